@@ -0,0 +1,137 @@
+"""
+Shared helpers of the benchmark scripts: app environment, uvicorn server, memory and latency stats.
+"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+
+def app_env(database: str | None = None):
+    """
+    Builds the environment the app modules are imported with.
+    Without a database URL the app runs in DEBUG mode on a SQLite file in the working directory.
+    """
+    env = dict(os.environ, PYTHONPATH=str(SRC_DIR), COOKIE_SECURE="False")
+    if database:
+        env.update(
+            DEBUG="False",
+            DATABASE=database,
+            SECRET_KEY=env.get("SECRET_KEY", "benchmark-secret"),
+            COOKIE_NAME=env.get("COOKIE_NAME", "fast-task-tracker-session"))
+    return env
+
+
+def use_app_env(work_dir: str, database: str | None = None):
+    """
+    Prepares the current process to import the app modules (main, models, database...).
+    Must run before the first app import, because settings are read at import time.
+    """
+    os.environ.update(app_env(database))
+    os.chdir(work_dir)
+    if str(SRC_DIR) not in sys.path:
+        sys.path.insert(0, str(SRC_DIR))
+
+
+def free_port():
+    """
+    Asks the OS for a free local TCP port.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _proc_status_mb(pid: int, field: str):
+    """
+    Reads a memory field of /proc/<pid>/status in MB (Linux only).
+    """
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb(pid: int):
+    """
+    Reads the peak resident memory of the process (Linux only).
+    """
+    return _proc_status_mb(pid, "VmHWM")
+
+
+def current_rss_mb(pid: int):
+    """
+    Reads the current resident memory of the process (Linux only).
+    """
+    return _proc_status_mb(pid, "VmRSS")
+
+
+def wait_for_server(base_url: str, timeout: float = 30):
+    """
+    Polls the server until it answers or the timeout passes.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{base_url}/api/tasks/server-time")
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+
+@contextmanager
+def uvicorn_server(work_dir: str, database: str | None = None, extra_args: tuple = ()):
+    """
+    Runs the app in a real uvicorn process for the duration of the block.
+    Yields the server base URL and the process.
+    """
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning", *extra_args],
+        cwd=work_dir, env=app_env(database), stdout=subprocess.DEVNULL)
+    try:
+        wait_for_server(base_url)
+        yield base_url, server
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summarize(latencies: list, seconds: float, errors: int = 0):
+    """
+    Turns the latencies (in seconds) of one scenario into throughput and p50/p95/p99 in ms.
+    """
+    count = len(latencies)
+    summary = {
+        "count": count,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput": round(count / seconds, 1) if seconds else None}
+
+    if count >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        summary.update(
+            p50_ms=round(cuts[49] * 1000, 3),
+            p95_ms=round(cuts[94] * 1000, 3),
+            p99_ms=round(cuts[98] * 1000, 3))
+    elif count == 1:
+        summary.update(
+            p50_ms=round(latencies[0] * 1000, 3),
+            p95_ms=round(latencies[0] * 1000, 3),
+            p99_ms=round(latencies[0] * 1000, 3))
+
+    return summary
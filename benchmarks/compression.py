@@ -0,0 +1,81 @@
+"""
+Bytes-on-wire and CPU benchmark of the response compression on GET /api/tasks/.
+
+Seeds one user with --tasks tasks, then requests the list in-process through the
+tasks router without compression and with CompressionMiddleware at each --levels
+gzip level. Reports the raw (on the wire) response size and server CPU per request.
+
+Usage (from the repo root):
+    python benchmarks/compression.py --tasks 500 --requests 200 --levels 1 6 9
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import httpx
+
+from common import use_app_env
+from suite import PASSWORD, seed
+
+
+async def measure(app, headers: dict, requests: int):
+    """
+    Requests the tasks list and returns the raw response size and CPU milliseconds per request.
+    Raw bytes are read without decoding, so the client does not spend CPU on gunzip.
+    """
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        cpu_started = time.process_time()
+        for _ in range(requests):
+            async with client.stream("GET", "/api/tasks/", headers=headers) as response:
+                response.raise_for_status()
+                wire_bytes = 0
+                async for chunk in response.aiter_raw():
+                    wire_bytes += len(chunk)
+        cpu_seconds = time.process_time() - cpu_started
+
+    return {"wire_bytes": wire_bytes, "cpu_ms_per_request": round(cpu_seconds / requests * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 6, 9])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        use_app_env(work_dir)
+        (email,) = seed(owners=1, tasks_per_owner=args.tasks)
+
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from compression import CompressionMiddleware
+        from routers import auth, tasks
+        import settings
+
+        tasks_app = FastAPI()
+        tasks_app.include_router(router=auth.router, prefix=f"{settings.API_LINK}/auth")
+        tasks_app.include_router(router=tasks.router, prefix=f"{settings.API_LINK}/tasks")
+        token = TestClient(tasks_app).post(
+            f"{settings.API_LINK}/auth/login", json={"email": email, "pasword": PASSWORD}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip"}
+
+        results = {}
+        # The endpoint prints debug logs on every request, keep them out of the results
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            results["uncompressed"] = asyncio.run(measure(tasks_app, headers, args.requests))
+            for level in args.levels:
+                compressed_app = CompressionMiddleware(
+                    tasks_app, minimum_size=settings.COMPRESSION_MINIMUM_SIZE, compresslevel=level)
+                results[f"gzip_level_{level}"] = asyncio.run(measure(compressed_app, headers, args.requests))
+
+    print(json.dumps({"tasks": args.tasks, "requests": args.requests, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
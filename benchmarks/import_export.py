@@ -0,0 +1,88 @@
+"""
+Memory and throughput benchmark of the tasks bulk import and streaming export.
+
+Starts the app with uvicorn in a temporary directory (fresh SQLite DB),
+uploads a generated file of --rows tasks, exports it back and reports
+rows per second and the server peak RSS for both directions.
+
+Usage (from the repo root):
+    python benchmarks/import_export.py --rows 1000000 --format ndjson
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import httpx
+
+from common import current_rss_mb, peak_rss_mb, uvicorn_server
+
+
+def generate_body(rows: int, file_format: str):
+    """
+    Lazily generates an import file, so the client side stays constant in memory too.
+    """
+    if file_format == "csv":
+        yield b"title,description,is_completed,timer_lenght\n"
+    for i in range(rows):
+        if file_format == "csv":
+            line = f"task {i},benchmark task number {i},{i % 2 == 0},{60 + i % 600}\n"
+        else:
+            line = json.dumps({
+                "title": f"task {i}",
+                "description": f"benchmark task number {i}",
+                "is_completed": i % 2 == 0,
+                "timer_lenght": 60 + i % 600}) + "\n"
+        yield line.encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        with uvicorn_server(work_dir) as (base_url, server):
+            idle_rss = current_rss_mb(server.pid)
+
+            with httpx.Client(base_url=base_url, timeout=None) as client:
+                started = time.perf_counter()
+                response = client.post(
+                    f"/api/tasks/import?format={args.format}",
+                    content=generate_body(args.rows, args.format))
+                response.raise_for_status()
+                import_seconds = time.perf_counter() - started
+                import_rss = peak_rss_mb(server.pid)
+
+                started = time.perf_counter()
+                exported_bytes = exported_rows = 0
+                with client.stream("GET", f"/api/tasks/export?format={args.format}") as export:
+                    for chunk in export.iter_bytes():
+                        exported_bytes += len(chunk)
+                        exported_rows += chunk.count(b"\n")
+                export_seconds = time.perf_counter() - started
+                export_rss = peak_rss_mb(server.pid)
+
+    if args.format == "csv":
+        exported_rows -= 1
+
+    print(json.dumps({
+        "rows": args.rows,
+        "format": args.format,
+        "import": {
+            **response.json(),
+            "seconds": round(import_seconds, 2),
+            "rows_per_second": round(args.rows / import_seconds),
+            "server_peak_rss_mb": import_rss},
+        "export": {
+            "rows": exported_rows,
+            "bytes": exported_bytes,
+            "seconds": round(export_seconds, 2),
+            "rows_per_second": round(exported_rows / export_seconds),
+            "server_peak_rss_mb": export_rss},
+        "server_idle_rss_mb": idle_rss}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Memory benchmark of the in-process state kept per running task timer.
+
+Compares the TimerRegistry record (ActiveTimer + heap entry) with the previous
+approach of one APScheduler date job per timer, and reports bytes per active timer
+measured with tracemalloc. Also reports what one open /ws/timer countdown socket
+costs on top of that (WebSocket, its handler coroutine and the TimerCountdown entry),
+driven through the ASGI interface, so the uvicorn protocol objects are not included.
+
+Usage (from the repo root):
+    python benchmarks/timer_memory.py --timers 10000 100000 --sockets 1000
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from common import use_app_env
+
+
+def owner(i: int):
+    """
+    Returns (user_id, guest_id) of a timer owner, every second owner is a guest.
+    """
+    return (None, str(uuid.uuid4())) if i % 2 else (i, None)
+
+
+def registry_bytes(timers: int):
+    """
+    Bytes allocated by a TimerRegistry holding the given number of running timers.
+    """
+    owners = [owner(i) for i in range(timers)]
+    started = time.time()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    from timer_registry import TimerRegistry
+
+    registry = TimerRegistry()
+    for task_id, (user_id, guest_id) in enumerate(owners):
+        registry.add("main", task_id, user_id, guest_id, started, started + 60 + task_id % 3600)
+
+    allocated = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+    assert len(registry) == timers
+    return allocated
+
+
+def apscheduler_bytes(timers: int):
+    """
+    Bytes allocated by a paused APScheduler holding one date job per running timer.
+    """
+    scheduler = BackgroundScheduler()
+    scheduler.start(paused=True)
+    run_date = datetime.now() + timedelta(hours=1)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    for task_id in range(timers):
+        scheduler.add_job(print, 'date', run_date=run_date + timedelta(seconds=task_id % 3600), args=[task_id])
+
+    allocated = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+    scheduler.shutdown(wait=False)
+    return allocated
+
+
+async def open_sockets(app, connections: int):
+    """
+    Opens countdown sockets through the ASGI interface and waits for the first message of each.
+    Returns the bytes allocated while they are open, then disconnects them.
+    """
+    path = "/ws/timer/3600"
+    scope = {
+        "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "path": path,
+        "raw_path": path.encode(), "root_path": "", "query_string": b"", "headers": [],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80), "subprotocols": []}
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sessions = []
+    for _ in range(connections):
+        inbox, outbox = asyncio.Queue(), asyncio.Queue()
+        await inbox.put({"type": "websocket.connect"})
+        sessions.append((inbox, asyncio.create_task(app(dict(scope), inbox.get, outbox.put)), outbox))
+    for _, _, outbox in sessions:
+        while (await outbox.get())["type"] != "websocket.send":
+            pass
+
+    allocated = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+    for inbox, session, _ in sessions:
+        await inbox.put({"type": "websocket.disconnect", "code": 1000})
+        await session
+    return allocated
+
+
+def socket_bytes(connections: int):
+    """
+    Bytes allocated per open countdown socket of the socket_manager router.
+    """
+    from fastapi import FastAPI
+    import socket_manager
+
+    app = FastAPI()
+    app.include_router(socket_manager.router)
+    return asyncio.run(open_sockets(app, connections))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timers", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--sockets", type=int, default=1000, help="open countdown sockets to measure")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        use_app_env(work_dir)
+        for timers in args.timers:
+            registry = registry_bytes(timers)
+            apscheduler = apscheduler_bytes(timers)
+            results[str(timers)] = {
+                "registry_bytes_per_timer": round(registry / timers),
+                "apscheduler_job_bytes_per_timer": round(apscheduler / timers)}
+        results["socket_bytes_per_connection"] = round(socket_bytes(args.sockets) / args.sockets)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
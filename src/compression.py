@@ -0,0 +1,26 @@
+from starlette.middleware.gzip import GZipMiddleware
+import settings
+
+# Files in these formats are compressed already, gzip would only burn CPU on them
+PRECOMPRESSED_EXTENSIONS = (
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif",
+    ".mp3", ".mp4", ".ogg", ".webm", ".woff", ".woff2", ".gz", ".zip")
+
+
+class CompressionMiddleware:
+    """
+    Gzip compression of HTTP responses bigger than minimum_size, streamed responses included.
+    WebSockets and already compressed static files go out as they are.
+    """
+    def __init__(
+        self,
+        app,
+        minimum_size: int = settings.COMPRESSION_MINIMUM_SIZE,
+        compresslevel: int = settings.COMPRESSION_LEVEL):
+        self.app = app
+        self.gzip_app = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].lower().endswith(PRECOMPRESSED_EXTENSIONS):
+            return await self.gzip_app(scope, receive, send)
+        return await self.app(scope, receive, send)
@@ -4,10 +4,17 @@ from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE
 
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+def create_db_engine(database_url: str):
+    """
+    Creates an engine for the database URL, allowing SQLite connections to be shared between threads.
+    """
+    if database_url.startswith("sqlite"):
+        return create_engine(database_url, connect_args={"check_same_thread": False})
+    return create_engine(database_url)
+
+
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 
 
 class Base(DeclarativeBase):
@@ -0,0 +1,325 @@
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from collections import OrderedDict
+from typing import Optional
+from database import LocalSession
+from models import IdempotencyRecord
+import settings
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+IDEMPOTENCY_KEY_MAX_LENGHT = 255
+
+# (method, path) of the mutations that accept an Idempotency-Key
+IDEMPOTENT_ROUTES = (
+    ("POST", re.compile(rf"^{settings.API_LINK}/tasks/?$")),
+    ("PUT", re.compile(rf"^{settings.API_LINK}/tasks/\d+/?$")),
+    ("PUT", re.compile(rf"^{settings.API_LINK}/tasks/\d+/(timer_start|timer_stop)/?$")),
+)
+
+
+class StoredResponse:
+    """
+    Compact record of a finished response, replayed for retries with the same key.
+    """
+    __slots__ = ("fingerprint", "status", "headers", "body", "expires")
+
+    def __init__(self, fingerprint: bytes, status: int, headers: list, body: bytes, expires: float):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+
+
+class IdempotencyCache:
+    """
+    Bounded TTL cache of recent idempotency keys -> stored responses.
+    The least recently used key is evicted once max_keys is reached.
+    """
+    def __init__(self, max_keys: int, ttl_seconds: float):
+        """
+        Initializes an empty cache with the given size and time-to-live limits.
+        """
+        self.max_keys = max_keys
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple, StoredResponse] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: tuple):
+        """
+        Returns the stored response of the key or None if it is unknown or expired.
+        """
+        with self._lock:
+            stored = self._entries.get(key)
+            if stored is None:
+                return None
+            if stored.expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return stored
+
+    def set(self, key: tuple, fingerprint: bytes, status: int, headers: list, body: bytes):
+        """
+        Stores the response of the key, evicting the oldest keys over the limit.
+        """
+        stored = StoredResponse(fingerprint, status, headers, body, time.monotonic() + self.ttl_seconds)
+        with self._lock:
+            self._entries[key] = stored
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+        return stored
+
+
+idempotency_cache = IdempotencyCache(settings.IDEMPOTENCY_MAX_KEYS, settings.IDEMPOTENCY_TTL_SECONDS)
+
+
+class MemoryIdempotencyStore:
+    """
+    Idempotency state of one server process: the cache of stored responses and the keys
+    whose first request is still running. Enough for a single worker only.
+    """
+    def __init__(self, cache: Optional[IdempotencyCache] = None):
+        self.cache = idempotency_cache if cache is None else cache
+        self._in_flight: dict[tuple, asyncio.Event] = {}
+
+    async def claim(self, key: tuple):
+        """
+        Returns the stored response of the key, or None after reserving the key for the caller.
+        A retry that arrives while the first request is still running waits for it.
+        The caller that got None must call finish().
+        """
+        while key in self._in_flight:
+            await self._in_flight[key].wait()
+
+        stored = self.cache.get(key)
+        if stored is None:
+            self._in_flight[key] = asyncio.Event()
+        return stored
+
+    async def finish(self, key: tuple, fingerprint: bytes, status: int, headers: list, body: bytes):
+        """
+        Stores a 2xx response of the reserved key and releases the key.
+        """
+        try:
+            if 200 <= status < 300:
+                self.cache.set(key, fingerprint, status, headers, body)
+        finally:
+            self._in_flight.pop(key).set()
+
+
+class DatabaseIdempotencyStore:
+    """
+    Idempotency state in the idempotency_records table, shared by all server workers.
+    The first request inserts a pending row for its key, so a retry that lands on another worker
+    sees it and polls until the response is stored. Expired rows are replaced and purged now and then.
+    """
+    PURGE_EVERY = 100
+
+    def __init__(
+        self,
+        session_factory: sessionmaker = LocalSession,
+        ttl_seconds: float = settings.IDEMPOTENCY_TTL_SECONDS,
+        pending_seconds: float = settings.IDEMPOTENCY_PENDING_SECONDS,
+        poll_seconds: float = 0.05):
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+        self.pending_seconds = pending_seconds
+        self.poll_seconds = poll_seconds
+        self._finished = 0
+
+    @staticmethod
+    def _record_key(key: tuple):
+        return hashlib.sha256("\x00".join(key).encode()).hexdigest()
+
+    def _claim(self, record_key: str):
+        """
+        Inserts the pending row of the key. Returns True if this call owns the key now,
+        the stored response if there is one, or False while another request is running.
+        """
+        db = self.session_factory()
+        try:
+            time_now = time.time()
+            record = db.get(IdempotencyRecord, record_key)
+            if record is not None and record.expires <= time_now:
+                db.execute(delete(IdempotencyRecord).where(
+                    IdempotencyRecord.key == record_key, IdempotencyRecord.expires <= time_now))
+                db.commit()
+                record = None
+
+            if record is None:
+                try:
+                    db.add(IdempotencyRecord(key=record_key, expires=time_now + self.pending_seconds))
+                    db.commit()
+                    return True
+                except IntegrityError:
+                    db.rollback()
+                    return False
+
+            if record.status is None:
+                return False
+            headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(record.headers)]
+            return StoredResponse(record.fingerprint, record.status, headers, record.body, record.expires)
+        finally:
+            db.close()
+
+    def _finish(self, record_key: str, fingerprint: bytes, status: int, headers: list, body: bytes):
+        """
+        Stores a 2xx response in the pending row, otherwise deletes the row so the key can be retried for real.
+        """
+        db = self.session_factory()
+        try:
+            if 200 <= status < 300:
+                db.execute(
+                    update(IdempotencyRecord)
+                    .where(IdempotencyRecord.key == record_key)
+                    .values(
+                        fingerprint=fingerprint,
+                        status=status,
+                        headers=json.dumps([(name.decode("latin-1"), value.decode("latin-1")) for name, value in headers]),
+                        body=body,
+                        expires=time.time() + self.ttl_seconds))
+            else:
+                db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.key == record_key))
+
+            self._finished += 1
+            if self._finished % self.PURGE_EVERY == 0:
+                db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.expires <= time.time()))
+            db.commit()
+        finally:
+            db.close()
+
+    async def claim(self, key: tuple):
+        """
+        Returns the stored response of the key, or None after reserving the key for the caller.
+        The caller that got None must call finish().
+        """
+        record_key = self._record_key(key)
+        while True:
+            claimed = await run_in_threadpool(self._claim, record_key)
+            if claimed is True:
+                return None
+            if claimed is not False:
+                return claimed
+            await asyncio.sleep(self.poll_seconds)
+
+    async def finish(self, key: tuple, fingerprint: bytes, status: int, headers: list, body: bytes):
+        await run_in_threadpool(self._finish, self._record_key(key), fingerprint, status, headers, body)
+
+
+def create_idempotency_store():
+    """
+    Picks the store from IDEMPOTENCY_STORE. By default a production server with several
+    workers shares the keys in the database, a single process keeps them in memory.
+    """
+    store = settings.IDEMPOTENCY_STORE or (
+        "database" if not settings.DEBUG and settings.SERVER_WORKERS > 1 else "memory")
+    if store == "database":
+        return DatabaseIdempotencyStore()
+    if store == "memory":
+        return MemoryIdempotencyStore()
+    raise ValueError(f"Unknown IDEMPOTENCY_STORE: {store}")
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware that answers retried task mutations with the same Idempotency-Key
+    from memory, without calling the endpoint (and the DB) again.
+    Keys are scoped by the caller credentials, so one client can not replay another one's response.
+    A retry that arrives while the first request is still running waits for its response.
+    Only 2xx responses are stored, so failed requests can be retried for real.
+    """
+    def __init__(self, app, store=None):
+        self.app = app
+        self.store = create_idempotency_store() if store is None else store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(
+                scope["method"] == method and path.match(scope["path"]) for method, path in IDEMPOTENT_ROUTES):
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not idempotency_key:
+            return await self.app(scope, receive, send)
+        if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGHT:
+            response = JSONResponse(
+                {"detail": f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGHT} characters"},
+                status_code=400)
+            return await response(scope, receive, send)
+
+        caller = hashlib.sha256(
+            f"{request.headers.get('authorization', '')}|{request.cookies.get(settings.COOKIE_NAME, '')}".encode()
+        ).hexdigest()
+        cache_key = (caller, scope["method"], scope["path"].rstrip("/"), idempotency_key)
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        fingerprint = hashlib.sha256(body).digest()
+
+        stored = await self.store.claim(cache_key)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                response = JSONResponse(
+                    {"detail": "This Idempotency-Key was already used with a different request"},
+                    status_code=422)
+                return await response(scope, receive, send)
+            await send({
+                "type": "http.response.start",
+                "status": stored.status,
+                "headers": [*stored.headers, (REPLAYED_HEADER, b"true")]})
+            await send({"type": "http.response.body", "body": stored.body})
+            return None
+
+        response_start = {}
+        response_body = []
+        try:
+            await self._call(scope, receive, send, body, response_start, response_body)
+        finally:
+            await self.store.finish(
+                cache_key, fingerprint, response_start.get("status", 500),
+                response_start.get("headers", []), b"".join(response_body))
+
+    async def _call(self, scope, receive, send, body: bytes, response_start: dict, response_body: list):
+        """
+        Runs the endpoint with the already read body and captures its response.
+        """
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                # Copied, the outer gzip middleware rewrites the sent headers list in place
+                response_start.update(message, headers=list(message.get("headers", [])))
+            elif message["type"] == "http.response.body":
+                response_body.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, replay_receive, capture_send)
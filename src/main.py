@@ -1,15 +1,27 @@
+import logging
 import uvicorn
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
 from database import engine, Base
+from compression import CompressionMiddleware
+from idempotency import IdempotencyMiddleware
+from sharding import shard_router
 from routers import auth, tasks, site_pages
 import settings
 import socket_manager
 
+# App loggers (e.g. import progress) print next to the uvicorn logs, third-party ones stay at WARNING
+logging.basicConfig(format="%(levelname)s:     %(name)s - %(message)s")
+logging.getLogger("routers").setLevel(logging.INFO)
+
 Base.metadata.create_all(bind=engine)
+shard_router.create_all()
+tasks.load_active_timers()
 
 app = FastAPI(title="Fast Task Tracker", description="I'm Batman")
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(CompressionMiddleware)
 app.mount("/static", StaticFiles(directory=settings.STATIC_DIR), name="static")
 app.include_router(router=auth.router, prefix=f"{settings.API_LINK}/auth")
 app.include_router(router=tasks.router, prefix=f"{settings.API_LINK}/tasks")
@@ -20,8 +32,25 @@ app.include_router(router=socket_manager.router)
 def main():
     """
     Starts the FastAPI application using uvicorn on main.py file run.
+    In DEBUG mode runs a single auto-reloading process, otherwise the tuned production server.
     """
-    uvicorn.run(app="main:app", host=settings.HOST, port=settings.PORT, reload=settings.DEBUG)
+    if settings.DEBUG:
+        uvicorn.run(app="main:app", host=settings.HOST, port=settings.PORT, reload=True)
+        return
+
+    if settings.SERVER_WORKERS > 1 and settings.IDEMPOTENCY_STORE == "memory":
+        logging.getLogger(__name__).warning(
+            "IDEMPOTENCY_STORE=memory with %d workers, retries on another worker run the request again",
+            settings.SERVER_WORKERS)
+    uvicorn.run(
+        app="main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=settings.SERVER_WORKERS,
+        loop=settings.SERVER_LOOP,
+        http=settings.SERVER_HTTP,
+        timeout_keep_alive=settings.SERVER_KEEP_ALIVE_SECONDS,
+        backlog=settings.SERVER_BACKLOG)
 
 if __name__ == "__main__":
     main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Index, Float, LargeBinary, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -13,7 +13,7 @@ class User(Base):
     email = Column(String, index=True, unique=True)
     pasword_hash = Column(String)
     created_at = Column(DateTime(timezone=True), default=func.now())
-    tasks = relationship("Task", back_populates="user")
+    tasks = relationship("Task", back_populates="user", primaryjoin="User.id == foreign(Task.user_id)")
 
 
 class Task(Base):
@@ -25,6 +25,8 @@ class Task(Base):
     title = Column(String, index=True)
     description = Column(String, nullable=True)
     is_completed = Column(Boolean, default=False)
+    # Set while the completion is counted in the daily stats, imported completed tasks have none
+    completed_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -33,8 +35,9 @@ class Task(Base):
     timer_start = Column(DateTime(timezone=True), nullable=True)
     timer_stop = Column(DateTime(timezone=True), nullable=True)
 
-    user = relationship("User", back_populates="tasks")
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    # No DB foreign key: tasks may live on a shard without the users table rows
+    user = relationship("User", back_populates="tasks", primaryjoin="User.id == foreign(Task.user_id)")
+    user_id = Column(Integer, nullable=True)
     guest_id = Column(String, nullable=True)
 
 class GuestSession(Base):
@@ -45,3 +48,74 @@ class GuestSession(Base):
     id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class TimerSessionLog(Base):
+    """
+    Append-only DB model that stores every timer event (started, finished, aborted).
+    Rows are never updated, so the history survives timer restarts and task deletion.
+    """
+    __tablename__ = "timer_session_log"
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, index=True)
+    user_id = Column(Integer, nullable=True, index=True)
+    guest_id = Column(String, nullable=True, index=True)
+    event = Column(String)
+    event_time = Column(DateTime(timezone=True))
+    focus_seconds = Column(Integer, default=0)
+
+
+class DailyStats(Base):
+    """
+    DB model that stores per-owner running totals of task stats, one row per active day.
+    Each row holds the totals up to and including its day, so any date range
+    is answered by two rows: the last one inside the range and the last one before it.
+    """
+    __tablename__ = "daily_stats"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=True)
+    guest_id = Column(String, nullable=True)
+    day = Column(Date)
+    focus_seconds = Column(Integer, default=0)
+    tasks_completed = Column(Integer, default=0)
+    timers_finished = Column(Integer, default=0)
+    timers_aborted = Column(Integer, default=0)
+
+    # One row per owner and day, concurrent writers of a new day race on these
+    __table_args__ = (
+        Index("ix_daily_stats_user_day", "user_id", "day", unique=True),
+        Index("ix_daily_stats_guest_day", "guest_id", "day", unique=True),
+    )
+
+
+class IdempotencyRecord(Base):
+    """
+    DB model that stores the responses of Idempotency-Key requests, shared by all server workers.
+    A row without status is a request that is still running.
+    """
+    __tablename__ = "idempotency_records"
+    key = Column(String, primary_key=True)
+    fingerprint = Column(LargeBinary, nullable=True)
+    status = Column(Integer, nullable=True)
+    headers = Column(Text, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    expires = Column(Float, index=True)
+
+class OwnerShard(Base):
+    """
+    DB model that stores on which shard the tasks of an owner live.
+    Kept in the main database only. Owners without a row are placed by the hash ring.
+    """
+    __tablename__ = "owner_shards"
+    owner_key = Column(String, primary_key=True)
+    shard = Column(String)
+    moving = Column(Boolean, default=False)
+
+class IdSequence(Base):
+    """
+    DB model that stores the next free id of rows that must be unique over all shards (task ids).
+    Kept in the main database only, used when there is more than one shard.
+    """
+    __tablename__ = "id_sequences"
+    name = Column(String, primary_key=True)
+    next_id = Column(Integer)
@@ -1,29 +1,50 @@
-from fastapi import APIRouter, Request, Response, Depends, status, HTTPException
+from fastapi import APIRouter, Request, Response, Depends, Query, status, HTTPException
+from starlette.requests import HTTPConnection
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, insert, update
 from sqlalchemy.orm import Session
-from schemas import TaskCreate, TaskUpdate, TaskResponce
+from pydantic import ValidationError
+from schemas import TaskCreate, TaskUpdate, TaskResponce, TaskStatsResponce, TaskImport, TaskImportResponce
 from models import Task
-from datetime import datetime, timedelta
-from typing import Optional
-from database import get_db, SchedulerSession
+from datetime import datetime, timedelta, date
+from typing import Optional, Literal
+from database import get_db, LocalSession
+from sharding import shard_router, ShardSessions, get_shard_sessions
 from routers.auth import is_user_or_is_guest, create_guest_session_and_set_cookie
+from task_stats import log_timer_event, log_finished_timers, count_task_completion, get_stats_for_range, STATS_FIELDS, TIMER_STARTED, TIMER_ABORTED
+from timer_registry import TimerRegistry, ActiveTimer
 from apscheduler.schedulers.background import BackgroundScheduler
 
+import settings
+import codecs
+import csv
+import io
+import json
+import logging
+
+active_timers = TimerRegistry()
 task_timer_scheduler = BackgroundScheduler()
 task_timer_scheduler.start()
 router = APIRouter(tags=["tasks"])
+logger = logging.getLogger(__name__)
+EXPIRE_BATCH_SIZE = 500
 
 def create_task(
     db: Session, 
     task_info: TaskCreate, 
     guest_id: Optional[str] = None, 
-    user_id: Optional[int] = None):
+    user_id: Optional[int] = None,
+    task_id: Optional[int] = None):
     """
     Creates a new task in the database for a user or guest.
+    task_id is given when the shards share one id sequence, otherwise the database picks it.
     """
     if not guest_id and not user_id:
         raise ValueError("Provide user_id or guest_id - at least one field is mandatory")
 
     new_task = Task(
+        id = task_id,
         title = task_info.title, 
         description = task_info.description,
         timer_lenght = task_info.timer_lenght,
@@ -66,10 +87,11 @@ def get_task_by_id(
         raise ValueError("Provide user_id or guest_id - at least one field is mandatory")
     
 
-def _catch_user_task(task_id: int, request: Request, db: Session):
+def _catch_user_task(task_id: int, request: Request, db: Session, shards: ShardSessions):
     """
     The helper function to validate the fact of existance of
     exact task that user wants to interact with.
+    Returns the task, the name of its shard and the shard session it was loaded with.
     No touching is recommended.
     """
     current_user = is_user_or_is_guest(request, db)
@@ -77,23 +99,26 @@ def _catch_user_task(task_id: int, request: Request, db: Session):
     if current_user["is_guest"]:
         if current_user["needs_cookie"]:
             raise FileNotFoundError("Auth cookie not found. Reload the page")
-        task = get_task_by_id(db, task_id, guest_id = current_user["guest_id"])
+        shard, task_db = shards.for_owner(guest_id = current_user["guest_id"])
+        task = get_task_by_id(task_db, task_id, guest_id = current_user["guest_id"])
     else:
-        task = get_task_by_id(db, task_id, user_id = current_user["user_id"])
+        shard, task_db = shards.for_owner(user_id = current_user["user_id"])
+        task = get_task_by_id(task_db, task_id, user_id = current_user["user_id"])
 
     if task is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="This task was not found, please reload the page")
     
-    return task
+    return task, shard, task_db
 
 
 
 @router.get("/", response_model=list[TaskResponce])
 async def get_tasks(
     request: Request,
-    db: Session = Depends(get_db)):
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shard_sessions)):
     
     current_user = is_user_or_is_guest(request, db)
     print(f"GET tasks - Current user state: {current_user}")  # Debug log
@@ -102,20 +127,31 @@ async def get_tasks(
         if current_user["needs_cookie"]:
             return []
         else:
-            tasks = get_tasks_list(db, guest_id=current_user["guest_id"])
+            _, task_db = shards.for_owner(guest_id=current_user["guest_id"])
+            tasks = get_tasks_list(task_db, guest_id=current_user["guest_id"])
             print(f"Retrieved {len(tasks)} tasks for guest ID: {current_user['guest_id']}")  # Debug log
             return tasks
     else:
-        tasks = get_tasks_list(db, user_id=current_user["user_id"])
+        _, task_db = shards.for_owner(user_id=current_user["user_id"])
+        tasks = get_tasks_list(task_db, user_id=current_user["user_id"])
         print(f"Retrieved {len(tasks)} tasks for user ID: {current_user['user_id']}")  # Debug log
         return tasks
 
+def _new_task_id(shards: ShardSessions):
+    """
+    Returns the id of a new task when the shards share one id sequence, otherwise None.
+    """
+    task_ids = shards.allocate_task_ids()
+    return task_ids[0] if task_ids else None
+
+
 @router.post("/", response_model=TaskResponce)    
 async def add_task(
     task_data: TaskCreate, 
     request: Request,
     response: Response,
-    db: Session = Depends(get_db)):
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shard_sessions)):
 
     current_user = is_user_or_is_guest(request, db)
     print(f"Current user state: {current_user}")  # Debug log
@@ -125,30 +161,35 @@ async def add_task(
             print("Creating new guest session and setting cookie")  # Debug log
             new_guest_session = create_guest_session_and_set_cookie(db, response)
             print(f"Created guest session with ID: {new_guest_session.id}")  # Debug log
-            result = create_task(db, task_data, guest_id=new_guest_session.id)
+            _, task_db = shards.for_owner(guest_id=new_guest_session.id, assign=True)
+            result = create_task(task_db, task_data, guest_id=new_guest_session.id, task_id=_new_task_id(shards))
             print(f"Created task with guest_id: {new_guest_session.id}")  # Debug log
             return result
         else:
             guest_id = current_user["guest_id"]
             print(f"Using existing guest session: {guest_id}")  # Debug log
-            result = create_task(db, task_data, guest_id=guest_id)
+            _, task_db = shards.for_owner(guest_id=guest_id, assign=True)
+            result = create_task(task_db, task_data, guest_id=guest_id, task_id=_new_task_id(shards))
             print(f"Created task with existing guest_id: {guest_id}")  # Debug log
             return result
     
     user_id = current_user["user_id"]
     print(f"Creating task for logged in user with ID: {user_id}")  # Debug log
-    return create_task(db, task_data, user_id=user_id)
+    _, task_db = shards.for_owner(user_id=user_id, assign=True)
+    return create_task(task_db, task_data, user_id=user_id, task_id=_new_task_id(shards))
 
 @router.delete("/", status_code=status.HTTP_200_OK)
 def delete_task(
     task_id: int,
     request: Request,
-    db: Session = Depends(get_db)):
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shard_sessions)):
 
-    task = _catch_user_task(task_id, request, db)
+    task, shard, task_db = _catch_user_task(task_id, request, db, shards)
 
-    db.delete(task)
-    db.commit()
+    active_timers.remove(shard, task.id)
+    task_db.delete(task)
+    task_db.commit()
     return Response(status_code=status.HTTP_200_OK)
 
 @router.put("/{task_id}", response_model=TaskResponce)
@@ -156,55 +197,155 @@ def update_task(
     task_id: int,
     task_update: TaskUpdate,
     request: Request,
-    db: Session = Depends(get_db)):
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shard_sessions)):
 
-    task = _catch_user_task(task_id, request, db)
+    task, _, task_db = _catch_user_task(task_id, request, db, shards)
     
     if task_update.title:
         task.title = task_update.title
     if task_update.description:
         task.description = task_update.description
     if task_update.is_completed is not None:
+        count_task_completion(task_db, task, task_update.is_completed)
         task.is_completed = task_update.is_completed
     if task_update.timer_lenght:
         task.timer_lenght = task_update.timer_lenght
 
-    db.commit()
-    db.refresh(task)
+    task_db.commit()
+    task_db.refresh(task)
 
     return task
 
 
 
-def timer_status_change(task_id: int):
-    db_scheduler = SchedulerSession()
+def _load_active_timers(db: Session, shard: str, *filters):
+    """
+    Reads running timers of the shard as compact records, without loading Task instances.
+    """
+    query = select(Task.id, Task.user_id, Task.guest_id, Task.timer_start, Task.timer_stop).where(
+        Task.timer_active == True, Task.timer_stop.is_not(None), *filters)
+    return [
+        ActiveTimer(
+            shard, task_id, user_id, guest_id,
+            (timer_start or timer_stop).timestamp(), timer_stop.timestamp())
+        for task_id, user_id, guest_id, timer_start, timer_stop in db.execute(query)]
+
+
+def _finish_timers(db: Session, timers: list, time_now: datetime):
+    """
+    Flips timer_active off for the expired timers with bulk UPDATEs and logs the ones
+    that were still running. A timer restarted in the meantime has timer_stop in the future
+    and is left alone.
+    """
+    finished = []
+    for start in range(0, len(timers), EXPIRE_BATCH_SIZE):
+        batch = {timer.task_id: timer for timer in timers[start:start + EXPIRE_BATCH_SIZE]}
+        finished_ids = db.execute(
+            update(Task)
+            .where(Task.id.in_(batch), Task.timer_active == True, Task.timer_stop <= time_now)
+            .values(timer_active=False)
+            .returning(Task.id)
+            .execution_options(synchronize_session=False)).scalars().all()
+        finished += [batch[task_id] for task_id in finished_ids]
+
+    if finished:
+        log_finished_timers(db, finished, time_now)
+    db.commit()
+    return finished
+
+
+def load_active_timers():
+    """
+    Fills the registry with the timers that are running on every shard, e.g. after a server restart.
+    """
+    for shard in shard_router.engines:
+        db_scheduler = shard_router.session(shard)
+        try:
+            for timer in _load_active_timers(db_scheduler, shard):
+                active_timers.add(shard, timer.task_id, timer.user_id, timer.guest_id, timer.started, timer.deadline)
+        finally:
+            db_scheduler.close()
+
+
+def expire_due_timers():
+    """
+    Scheduler job that finishes every timer whose deadline has passed.
+    One job serves all timers of the process instead of one APScheduler job per timer.
+    """
+    time_now = datetime.now()
+    expired_by_shard = {}
+    for timer in active_timers.pop_expired(time_now.timestamp()):
+        expired_by_shard.setdefault(timer.shard, []).append(timer)
+
+    for shard, expired in expired_by_shard.items():
+        db_scheduler = shard_router.session(shard)
+        try:
+            _finish_timers(db_scheduler, expired, time_now)
+        finally:
+            db_scheduler.close()
+
+    return None
+
+
+def find_task_timer(connection: HTTPConnection, task_id: int):
+    """
+    Returns the running timer of the caller's task as an ActiveTimer record, or None.
+    Looks in the registry first and falls back to the owner's shard for timers started by another process.
+    """
+    db = LocalSession()
     try:
-        task = db_scheduler.query(Task).filter(Task.id == task_id).first()
-        if task and task.timer_active:
-            task.timer_active = False
-            db_scheduler.commit()
+        current_user = is_user_or_is_guest(connection, db)
+        if current_user["needs_cookie"]:
+            return None
+        user_id, guest_id = current_user.get("user_id"), current_user.get("guest_id")
+        try:
+            shard = shard_router.shard_for(db, user_id, guest_id)
+        except HTTPException:
+            return None
+
+        timer = active_timers.get(shard, task_id)
+        if timer is None:
+            task_db = ShardSessions(db).for_shard(shard)
+            try:
+                timer = next(iter(_load_active_timers(task_db, shard, Task.id == task_id)), None)
+            finally:
+                if task_db is not db:
+                    task_db.close()
+
+        if timer is None or (timer.guest_id != guest_id if guest_id else timer.user_id != user_id):
+            return None
+        return timer
     finally:
-        db_scheduler.close()
+        db.close()
 
-    return None
+
+task_timer_scheduler.add_job(
+    expire_due_timers, 'interval', seconds=settings.TIMER_TICK_SECONDS,
+    id="expire-due-timers", max_instances=1, coalesce=True)
 
 @router.put("/{task_id}/timer_start", response_model=TaskResponce)
 def start_timer(
     task_id: int,
     request: Request,
-    db: Session = Depends(get_db)):
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shard_sessions)):
+
+    task, shard, task_db = _catch_user_task(task_id, request, db, shards)
 
-    task = _catch_user_task(task_id, request, db)
+    if task.timer_active:
+        log_timer_event(task_db, task, TIMER_ABORTED)
+    log_timer_event(task_db, task, TIMER_STARTED)
     
     time_now = datetime.now()
     task.timer_start = time_now
     task.timer_stop = time_now + timedelta(seconds=task.timer_lenght)
     task.timer_active = True
 
-    db.commit()
-    db.refresh(task)
+    task_db.commit()
+    task_db.refresh(task)
 
-    task_timer_scheduler.add_job(timer_status_change, 'date', run_date=task.timer_stop, args=[task_id])
+    active_timers.add(shard, task.id, task.user_id, task.guest_id, time_now.timestamp(), task.timer_stop.timestamp())
 
     return task
 
@@ -212,16 +353,20 @@ def start_timer(
 def stop_timer(
     task_id: int,
     request: Request,
-    db: Session = Depends(get_db)):
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shard_sessions)):
     """
     Func that stops the timer on user's manual request
     """
-    task = _catch_user_task(task_id, request, db)
-    
+    task, shard, task_db = _catch_user_task(task_id, request, db, shards)
+
+    if task.timer_active:
+        log_timer_event(task_db, task, TIMER_ABORTED)
     task.timer_active = False
+    active_timers.remove(shard, task.id)
 
-    db.commit()
-    db.refresh(task)
+    task_db.commit()
+    task_db.refresh(task)
 
     return task
 
@@ -234,4 +379,304 @@ def get_server_time():
     This function is a backup function for the use cases of the DB
     that does not stores the timezone information in Datetime cells.
     """
-    return {"server_time": datetime.now().isoformat() + "Z"}
\ No newline at end of file
+    return {"server_time": datetime.now().isoformat() + "Z"}
+
+
+@router.get("/stats", response_model=TaskStatsResponce)
+def get_task_stats(
+    request: Request,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shard_sessions)):
+    """
+    Returns focus time, completed tasks and finished/aborted timers for the date range.
+    Defaults to the last 7 days. Answered from the daily rollups, not from the timer history.
+    """
+    date_to = date_to or datetime.now().date()
+    date_from = date_from or date_to - timedelta(days=6)
+    if date_from > date_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="date_from must not be later than date_to")
+
+    current_user = is_user_or_is_guest(request, db)
+
+    if current_user["is_guest"]:
+        if current_user["needs_cookie"]:
+            return {"date_from": date_from, "date_to": date_to, **{field: 0 for field in STATS_FIELDS}}
+        _, task_db = shards.for_owner(guest_id=current_user["guest_id"])
+        return get_stats_for_range(task_db, date_from, date_to, guest_id=current_user["guest_id"])
+    _, task_db = shards.for_owner(user_id=current_user["user_id"])
+    return get_stats_for_range(task_db, date_from, date_to, user_id=current_user["user_id"])
+
+
+
+EXPORT_FIELDS = ("id", "title", "description", "is_completed", "timer_lenght", "created_at", "updated_at")
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _export_value(value):
+    """
+    Converts a DB value to its export form. Datetimes go out in ISO format.
+    """
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _export_rows(shard: str, user_id: Optional[int] = None, guest_id: Optional[str] = None):
+    """
+    Yields the owner's task rows from a server-side cursor, EXPORT_BATCH_SIZE rows at a time.
+    Opens its own session on the shard, because the request sessions are closed before the response is streamed.
+    """
+    if not guest_id and not user_id:
+        return
+
+    db = shard_router.session(shard)
+    try:
+        owner_filter = Task.guest_id == guest_id if guest_id else Task.user_id == user_id
+        query = (
+            select(*(getattr(Task, field) for field in EXPORT_FIELDS))
+            .where(owner_filter)
+            .order_by(Task.id)
+            .execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        for row in db.execute(query):
+            yield row
+    finally:
+        db.close()
+
+
+def _export_stream(rows, export_format: str):
+    """
+    Serializes rows to NDJSON or CSV and yields them in chunks of about EXPORT_CHUNK_BYTES.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if export_format == "csv":
+        writer.writerow(EXPORT_FIELDS)
+
+    for row in rows:
+        values = [_export_value(value) for value in row]
+        if export_format == "csv":
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, values))) + "\n")
+
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
+
+
+class ImportRecordTooLarge(ValueError):
+    pass
+
+
+class _ImportRecordSplitter:
+    """
+    Splits the received text into complete records, chunk by chunk.
+    A CSV newline inside a quoted field does not end the record. The quote state and the
+    unfinished tail are kept between chunks, so every character is scanned only once.
+    """
+    def __init__(self, import_format: str, max_record_size: int = settings.IMPORT_MAX_RECORD_SIZE):
+        self.is_csv = import_format == "csv"
+        self.max_record_size = max_record_size
+        self._pending: list[str] = []
+        self._pending_size = 0
+        self._in_quotes = False
+
+    def _take(self, text: str):
+        """
+        Returns the pending tail joined with the text as one record and resets the tail.
+        """
+        self._pending.append(text)
+        record = "".join(self._pending).rstrip("\r")
+        self._pending = []
+        self._pending_size = 0
+        if len(record) > self.max_record_size:
+            raise ImportRecordTooLarge(f"An import record is longer than {self.max_record_size} characters")
+        return record
+
+    def feed(self, text: str):
+        """
+        Returns the records completed by the text. The rest is kept for the next call.
+        """
+        records = []
+        start = position = 0
+        while position < len(text):
+            if self._in_quotes:
+                quote = text.find('"', position)
+                if quote == -1:
+                    break
+                self._in_quotes = False
+                position = quote + 1
+                continue
+
+            quote = text.find('"', position) if self.is_csv else -1
+            stop = len(text) if quote == -1 else quote
+            end = text.find("\n", position, stop)
+            while end != -1:
+                records.append(self._take(text[start:end]))
+                start = end + 1
+                end = text.find("\n", start, stop)
+            if quote == -1:
+                break
+            self._in_quotes = True
+            position = quote + 1
+
+        if start < len(text):
+            self._pending.append(text[start:])
+            self._pending_size += len(text) - start
+            if self._pending_size > self.max_record_size:
+                raise ImportRecordTooLarge(f"An import record is longer than {self.max_record_size} characters")
+        return records
+
+    def finish(self):
+        """
+        Returns the last record, which may have no trailing newline.
+        """
+        return [self._take("")]
+
+
+async def _read_import_rows(request: Request, import_format: str):
+    """
+    Parses the uploaded body as it arrives and yields one dict per record.
+    Yields None for records that can not be parsed.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    splitter = _ImportRecordSplitter(import_format)
+    header = None
+
+    def parse(records):
+        nonlocal header
+        for record in records:
+            if not record.strip():
+                continue
+            if import_format == "csv":
+                try:
+                    values = next(csv.reader([record]))
+                except csv.Error:
+                    yield None
+                    continue
+                if header is None:
+                    header = values
+                    continue
+                yield {key: value for key, value in zip(header, values) if value != ""}
+            else:
+                try:
+                    row = json.loads(record)
+                except ValueError:
+                    row = None
+                yield row if isinstance(row, dict) else None
+
+    async for chunk in request.stream():
+        for row in parse(splitter.feed(decoder.decode(chunk))):
+            yield row
+
+    for row in parse(splitter.feed(decoder.decode(b"", final=True)) + splitter.finish()):
+        yield row
+
+
+def _insert_import_batch(db: Session, batch: list, shards: ShardSessions):
+    """
+    Inserts a batch of imported tasks with a single executemany and commits it.
+    """
+    task_ids = shards.allocate_task_ids(len(batch))
+    if task_ids:
+        batch = [{**row, "id": task_id} for row, task_id in zip(batch, task_ids)]
+    db.execute(insert(Task), batch)
+    db.commit()
+
+
+@router.get("/export")
+def export_tasks(
+    request: Request,
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    db: Session = Depends(get_db)):
+    """
+    Streams all tasks of the current user or guest as NDJSON or CSV.
+    Rows are read from a server-side cursor, so memory usage does not depend on the number of tasks.
+    """
+    current_user = is_user_or_is_guest(request, db)
+
+    if current_user["is_guest"]:
+        if current_user["needs_cookie"]:
+            rows = iter(())
+        else:
+            guest_id = current_user["guest_id"]
+            rows = _export_rows(shard_router.shard_for(db, guest_id=guest_id), guest_id=guest_id)
+    else:
+        user_id = current_user["user_id"]
+        rows = _export_rows(shard_router.shard_for(db, user_id=user_id), user_id=user_id)
+
+    return StreamingResponse(
+        _export_stream(rows, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f"attachment; filename=tasks.{export_format}"})
+
+
+@router.post("/import", response_model=TaskImportResponce)
+async def import_tasks(
+    request: Request,
+    response: Response,
+    import_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shard_sessions)):
+    """
+    Imports tasks from a raw NDJSON or CSV request body (same fields as the export).
+    The body is parsed while it is received and inserted in IMPORT_BATCH_SIZE batches
+    in the threadpool, so the inserts do not block the event loop.
+    Records that fail validation are skipped. Timers are never imported as running.
+    A record over IMPORT_MAX_RECORD_SIZE stops the import with 413, the batches before it stay imported.
+    """
+    current_user = is_user_or_is_guest(request, db)
+
+    if current_user["is_guest"]:
+        if current_user["needs_cookie"]:
+            owner = {"user_id": None, "guest_id": create_guest_session_and_set_cookie(db, response).id}
+        else:
+            owner = {"user_id": None, "guest_id": current_user["guest_id"]}
+    else:
+        owner = {"user_id": current_user["user_id"], "guest_id": None}
+    _, task_db = shards.for_owner(**owner, assign=True)
+
+    imported = skipped = batches = 0
+    batch = []
+    try:
+        async for row in _read_import_rows(request, import_format):
+            try:
+                task_info = TaskImport.model_validate(row)
+            except ValidationError:
+                skipped += 1
+                continue
+
+            batch.append({
+                "title": task_info.title,
+                "description": task_info.description,
+                "is_completed": bool(task_info.is_completed),
+                "timer_lenght": task_info.timer_lenght,
+                "timer_active": False,
+                "created_at": task_info.created_at or datetime.now(),
+                **owner})
+
+            if len(batch) >= settings.IMPORT_BATCH_SIZE:
+                await run_in_threadpool(_insert_import_batch, task_db, batch, shards)
+                imported += len(batch)
+                batches += 1
+                batch = []
+                logger.info("Import progress for %s: %d tasks imported, %d skipped", owner, imported, skipped)
+    except ImportRecordTooLarge as error:
+        logger.warning("Import stopped for %s after %d tasks: %s", owner, imported, error)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"{error}, {imported} tasks were imported before it")
+
+    if batch:
+        await run_in_threadpool(_insert_import_batch, task_db, batch, shards)
+        imported += len(batch)
+        batches += 1
+
+    logger.info("Import finished for %s: %d tasks imported, %d skipped in %d batches", owner, imported, skipped, batches)
+    return {"imported": imported, "skipped": skipped, "batches": batches}
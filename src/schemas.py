@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, field_validator
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, date
 
 
 
@@ -61,6 +61,32 @@ class TaskResponce(TaskBase):
     timer_stop: Optional[datetime] = None
     user_id: Optional[int] = None
     guest_id: Optional[str] = None
+
+class TaskImport(TaskBase):
+    """
+    Schema of a single task row in the bulk import file
+    """
+    is_completed: Optional[bool] = False
+    created_at: Optional[datetime] = None
+
+class TaskImportResponce(BaseModel):
+    """
+    Bulk import summary responce schema
+    """
+    imported: int
+    skipped: int
+    batches: int
+
+class TaskStatsResponce(BaseModel):
+    """
+    Task time-tracking stats responce schema
+    """
+    date_from: date
+    date_to: date
+    focus_seconds: int
+    tasks_completed: int
+    timers_finished: int
+    timers_aborted: int
     
 
 
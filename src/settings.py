@@ -13,6 +13,16 @@ API_LINK = "/api"
 # Database settings
 DATABASE = "sqlite:///db.sqlite3" if DEBUG else os.environ.get("DATABASE")
 
+# Task sharding settings. SHARD_DATABASES is "name=url,name=url"; empty keeps all tasks in DATABASE.
+# Users, guest sessions and the owner -> shard directory always stay in DATABASE.
+SHARD_DATABASES = dict(
+    item.split("=", 1) for item in os.environ.get("SHARD_DATABASES", "").split(",") if item.strip())
+# Shards that keep serving the owners they have but get no new ones (e.g. before removing them)
+SHARD_DRAINING = [name for name in os.environ.get("SHARD_DRAINING", "").split(",") if name.strip()]
+# Optional separate (cheap) database for all guest tasks
+GUEST_SHARD_DATABASE = os.environ.get("GUEST_SHARD_DATABASE")
+SHARD_VIRTUAL_NODES = int(os.environ.get("SHARD_VIRTUAL_NODES", 64))
+
 # Security settings
 SECRET_KEY = "69secret69" if DEBUG else os.environ.get("SECRET_KEY")
 COOKIE_NAME = "fast-task-tracker-session" if DEBUG else os.environ.get("COOKIE_NAME")
@@ -22,6 +32,27 @@ JWT_ALGORITHM = "HS256"
 JWT_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 JWT_REFRESH_TOKEN_EXPIRE_DAYS = 30
 
+# Tasks export/import settings
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))
+# Longest accepted import record in characters, e.g. a CSV with an unclosed quote hits it
+IMPORT_MAX_RECORD_SIZE = int(os.environ.get("IMPORT_MAX_RECORD_SIZE", 128 * 1024))
+
+# How often the scheduler checks for finished task timers, in seconds
+TIMER_TICK_SECONDS = float(os.environ.get("TIMER_TICK_SECONDS", 1))
+
+# Idempotency-Key settings. IDEMPOTENCY_STORE is "memory" (per server process) or "database" (shared by
+# all workers, in DATABASE); empty picks "database" when more than one production worker runs.
+IDEMPOTENCY_STORE = os.environ.get("IDEMPOTENCY_STORE", "")
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get("IDEMPOTENCY_MAX_KEYS", 10000))
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 60 * 10))
+# How long a started request holds its key in the database store, a crashed worker's key is freed after it
+IDEMPOTENCY_PENDING_SECONDS = int(os.environ.get("IDEMPOTENCY_PENDING_SECONDS", 60))
+
+# Response compression settings
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MINIMUM_SIZE", 1000))
+COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL", 6))
+
 # Static files directory settings
 THIS_DIR = Path(__file__).resolve().parent
 STATIC_DIR = str(THIS_DIR) + "/static"
@@ -30,3 +61,10 @@ TEMPLATES_DIR = str(THIS_DIR) + "/templates"
 # Uvicorn server creds for dev usage
 HOST = "0.0.0.0"
 PORT = 6969
+
+# Uvicorn production server settings (used when DEBUG is False)
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", 1))
+SERVER_LOOP = os.environ.get("SERVER_LOOP", "auto") # auto picks uvloop if it is installed, else asyncio
+SERVER_HTTP = os.environ.get("SERVER_HTTP", "auto") # auto picks httptools if it is installed, else h11
+SERVER_KEEP_ALIVE_SECONDS = int(os.environ.get("SERVER_KEEP_ALIVE_SECONDS", 15))
+SERVER_BACKLOG = int(os.environ.get("SERVER_BACKLOG", 2048))
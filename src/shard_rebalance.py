@@ -0,0 +1,313 @@
+"""
+Maintenance commands for the task shards. Run from the src directory with the app settings.
+
+    python shard_rebalance.py pin
+        Writes a directory entry for every owner that has rows on a shard but none in the directory yet,
+        e.g. right after the existing database was listed in SHARD_DATABASES.
+
+    python shard_rebalance.py move [--owner KEY] [--dry-run] [--grace-seconds N]
+        Moves owners whose rows are not on the shard the hash ring gives them now
+        (after a shard was added, or listed in SHARD_DRAINING) to that shard.
+
+Moves are online: the owner is marked as moving (their requests get 503 with Retry-After),
+the rows are copied to the new shard and the copied rows are deleted from the old one, then the directory
+points to the new one. Task ids are unique over all shards and stay the same.
+If the owner's rows changed during the move, the copy is dropped and the owner stays where it was.
+Owners with a running timer or without a directory entry (run pin first) are skipped and picked up by the next run.
+"""
+import argparse
+import time
+
+from sqlalchemy import select, delete, insert, union
+from sqlalchemy.orm import Session
+
+from database import Base, engine, LocalSession
+from models import Task, TimerSessionLog, DailyStats, OwnerShard
+from sharding import ShardRouter, shard_router, owner_key
+from typing import Optional
+
+OWNER_MODELS = (Task, TimerSessionLog, DailyStats)
+# Task ids are unique over all shards and copied as they are,
+# timer log and stats rows get new ids from the target shard
+COPIED_ID_MODELS = (Task,)
+ID_CHUNK_SIZE = 500
+
+
+class MoveSkipped(Exception):
+    """
+    Raised when an owner is left on its shard, the message tells why.
+    """
+
+
+def _owner_filter(model, user_id: Optional[int] = None, guest_id: Optional[str] = None):
+    """
+    Builds the filter of the owner's rows of the model.
+    """
+    return model.guest_id == guest_id if guest_id else model.user_id == user_id
+
+
+def _chunks(values: list, size: int = ID_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _shard_owners(shard_db: Session):
+    """
+    Returns (user_id, guest_id) of every owner that has tasks, timer log or stats rows on the shard.
+    """
+    query = union(*(
+        select(model.user_id, model.guest_id) for model in OWNER_MODELS))
+    owners = {(user_id, guest_id) for user_id, guest_id in shard_db.execute(query) if user_id or guest_id}
+    return sorted(owners, key=lambda owner: (owner[0] or 0, owner[1] or ""))
+
+
+def _has_owner_rows(shard_db: Session, user_id: Optional[int] = None, guest_id: Optional[str] = None):
+    return any(
+        shard_db.execute(select(model.id).where(_owner_filter(model, user_id, guest_id)).limit(1)).first()
+        for model in OWNER_MODELS)
+
+
+def _has_running_timer(shard_db: Session, user_id: Optional[int] = None, guest_id: Optional[str] = None):
+    return shard_db.execute(
+        select(Task.id).where(_owner_filter(Task, user_id, guest_id), Task.timer_active == True).limit(1)
+    ).first() is not None
+
+
+def _set_placement(db: Session, key: str, shard: str, moving: bool):
+    """
+    Creates or updates the owner's directory entry and commits it.
+    """
+    placement = db.get(OwnerShard, key)
+    if placement is None:
+        db.add(OwnerShard(owner_key=key, shard=shard, moving=moving))
+    else:
+        placement.shard = shard
+        placement.moving = moving
+    db.commit()
+
+
+def _delete_owner_rows(shard_db: Session, user_id: Optional[int], guest_id: Optional[str]):
+    for model in OWNER_MODELS:
+        shard_db.execute(delete(model).where(_owner_filter(model, user_id, guest_id)))
+    shard_db.commit()
+
+
+def _copy_owner_rows(source_db: Session, target_db: Session, user_id: Optional[int], guest_id: Optional[str]):
+    """
+    Copies the owner's rows from the source to the target shard in one target transaction.
+    Returns the copied source rows by model, as they were read.
+    Raises MoveSkipped if a task id is already taken on the target (tasks created before the shared id sequence).
+    """
+    # Leftovers of an interrupted earlier move, the directory still places the owner on the source
+    for model in OWNER_MODELS:
+        target_db.execute(delete(model).where(_owner_filter(model, user_id, guest_id)))
+
+    copied = {}
+    for model in OWNER_MODELS:
+        copied[model] = [dict(row) for row in source_db.execute(
+            select(*model.__table__.c).where(_owner_filter(model, user_id, guest_id)).order_by(model.id)).mappings()]
+
+    task_ids = [task["id"] for task in copied[Task]]
+    for chunk in _chunks(task_ids):
+        if target_db.execute(select(Task.id).where(Task.id.in_(chunk)).limit(1)).first():
+            target_db.rollback()
+            raise MoveSkipped("some of its task ids are taken on the target shard")
+
+    for model, rows in copied.items():
+        if rows:
+            keep_id = model in COPIED_ID_MODELS
+            target_db.execute(
+                insert(model), [{name: value for name, value in row.items() if keep_id or name != "id"} for row in rows])
+    target_db.commit()
+    return copied
+
+
+def _delete_copied_rows(source_db: Session, copied: dict, user_id: Optional[int], guest_id: Optional[str]):
+    """
+    Deletes exactly the copied rows from the source shard in one transaction.
+    Rolls back and raises MoveSkipped if one of them was changed or deleted since the copy,
+    or the owner got new rows on the source.
+    """
+    try:
+        for model, rows in copied.items():
+            expected = {row["id"]: row for row in rows}
+            deleted = {}
+            for chunk in _chunks(list(expected)):
+                deleted.update((row["id"], dict(row)) for row in source_db.execute(
+                    delete(model)
+                    .where(model.id.in_(chunk), _owner_filter(model, user_id, guest_id))
+                    .returning(*model.__table__.c)).mappings())
+            if deleted != expected:
+                raise MoveSkipped("its rows changed during the move")
+
+        if _has_owner_rows(source_db, user_id, guest_id):
+            raise MoveSkipped("it got new rows during the move")
+    except Exception:
+        source_db.rollback()
+        raise
+    source_db.commit()
+
+
+def move_owner(
+    db: Session,
+    router: ShardRouter,
+    source: str,
+    target: str,
+    user_id: Optional[int] = None,
+    guest_id: Optional[str] = None,
+    grace_seconds: float = 2):
+    """
+    Moves one owner's rows from the source to the target shard.
+    The grace period lets requests that read the directory before the owner was marked as moving finish.
+    Returns the number of moved tasks. Raises MoveSkipped if the owner stays on the source:
+    it has a running timer, the directory does not place it on the source, or its rows changed during the move.
+    """
+    key = owner_key(user_id, guest_id)
+    placement = db.get(OwnerShard, key)
+    if placement is None:
+        raise MoveSkipped("it has no directory entry, run pin first")
+    if placement.shard != source:
+        raise MoveSkipped(f"the directory places it on {placement.shard}, not {source}")
+
+    source_db = router.session(source)
+    target_db = router.session(target)
+    try:
+        if _has_running_timer(source_db, user_id, guest_id):
+            raise MoveSkipped("a timer is running")
+        _set_placement(db, key, source, moving=True)
+        time.sleep(grace_seconds)
+
+        try:
+            source_db.rollback()
+            if _has_running_timer(source_db, user_id, guest_id):
+                raise MoveSkipped("a timer is running")
+            copied = _copy_owner_rows(source_db, target_db, user_id, guest_id)
+            try:
+                _delete_copied_rows(source_db, copied, user_id, guest_id)
+            except Exception:
+                _delete_owner_rows(target_db, user_id, guest_id)
+                raise
+        except Exception:
+            target_db.rollback()
+            _set_placement(db, key, source, moving=False)
+            raise
+        _set_placement(db, key, target, moving=False)
+        return len(copied[Task])
+    finally:
+        source_db.close()
+        target_db.close()
+
+
+def pin(db: Session, router: ShardRouter):
+    """
+    Writes directory entries for the owners found on the shards that have none yet.
+    """
+    pinned = 0
+    for shard in router.engines:
+        shard_db = router.session(shard)
+        try:
+            for user_id, guest_id in _shard_owners(shard_db):
+                key = owner_key(user_id, guest_id)
+                if db.get(OwnerShard, key) is None:
+                    db.add(OwnerShard(owner_key=key, shard=shard, moving=False))
+                    pinned += 1
+            db.commit()
+        finally:
+            shard_db.close()
+    print(f"Pinned {pinned} owners")
+
+
+def _check_stranded(
+    db: Session,
+    router: ShardRouter,
+    shard: str,
+    placement: OwnerShard,
+    user_id: Optional[int],
+    guest_id: Optional[str],
+    dry_run: bool):
+    """
+    Handles owner rows on a shard the directory does not place the owner on.
+    A move that was interrupted after the old shard was emptied is finished, other rows are only reported.
+    """
+    directory_db = router.session(placement.shard)
+    try:
+        interrupted = placement.moving and not _has_owner_rows(directory_db, user_id, guest_id)
+    finally:
+        directory_db.close()
+
+    if interrupted and not dry_run:
+        _set_placement(db, placement.owner_key, shard, moving=False)
+        print(f"{placement.owner_key}: finished an interrupted move to {shard}")
+    elif interrupted:
+        print(f"{placement.owner_key}: interrupted move to {shard} would be finished")
+    else:
+        print(f"{placement.owner_key}: warning, rows on {shard} while the directory places it on {placement.shard}, left as they are")
+
+
+def move(
+    db: Session,
+    router: ShardRouter,
+    only_owner: Optional[str] = None,
+    dry_run: bool = False,
+    grace_seconds: float = 2):
+    """
+    Moves every owner (or only_owner) whose rows are not on their hash ring shard.
+    """
+    moved = skipped = 0
+    for source in list(router.engines):
+        shard_db = router.session(source)
+        try:
+            owners = _shard_owners(shard_db)
+        finally:
+            shard_db.close()
+
+        for user_id, guest_id in owners:
+            key = owner_key(user_id, guest_id)
+            if only_owner and key != only_owner:
+                continue
+            placement = db.get(OwnerShard, key)
+            if placement is not None and placement.shard != source:
+                _check_stranded(db, router, source, placement, user_id, guest_id, dry_run)
+                continue
+            target = router.place(user_id, guest_id)
+            if target == source:
+                continue
+            if dry_run:
+                print(f"{key}: {source} -> {target}")
+                continue
+
+            try:
+                tasks_moved = move_owner(db, router, source, target, user_id, guest_id, grace_seconds)
+            except MoveSkipped as error:
+                skipped += 1
+                print(f"{key}: skipped, {error}")
+                continue
+            moved += 1
+            print(f"{key}: {source} -> {target}, {tasks_moved} tasks")
+    print(f"Moved {moved} owners, skipped {skipped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("pin", help="write directory entries for owners that have none")
+    move_parser = commands.add_parser("move", help="move owners to the shard the hash ring gives them")
+    move_parser.add_argument("--owner", help="move only this owner, e.g. user:42 or guest:<uuid>")
+    move_parser.add_argument("--dry-run", action="store_true", help="only print the planned moves")
+    move_parser.add_argument("--grace-seconds", type=float, default=2)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    shard_router.create_all()
+    db = LocalSession()
+    try:
+        if args.command == "pin":
+            pin(db, shard_router)
+        else:
+            move(db, shard_router, args.owner, args.dry_run, args.grace_seconds)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
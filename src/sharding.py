@@ -0,0 +1,229 @@
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+from database import Base, engine, create_db_engine, get_db
+from models import IdSequence, OwnerShard, Task
+from typing import Optional
+import settings
+import bisect
+import hashlib
+
+MAIN_SHARD = "main"
+GUEST_SHARD = "guests"
+TASK_ID_SEQUENCE = "tasks"
+
+
+def owner_key(user_id: Optional[int] = None, guest_id: Optional[str] = None):
+    """
+    Builds the key an owner is hashed and stored under in the shard directory.
+    """
+    if guest_id:
+        return f"guest:{guest_id}"
+    elif user_id:
+        return f"user:{user_id}"
+    else:
+        raise ValueError("Provide user_id or guest_id - at least one field is mandatory")
+
+
+def _ring_hash(key: str):
+    """
+    Stable 64-bit hash of a ring key (Python's hash() changes between processes).
+    """
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring of shard names. Each shard gets virtual_nodes points on the ring,
+    so adding or removing a shard only moves about 1/N of the owners.
+    """
+    def __init__(self, shard_names: list, virtual_nodes: int):
+        points = sorted((_ring_hash(f"{name}#{node}"), name) for name in shard_names for node in range(virtual_nodes))
+        self._hashes = [point_hash for point_hash, _ in points]
+        self._names = [name for _, name in points]
+
+    def get(self, key: str):
+        """
+        Returns the shard name the key falls on.
+        """
+        if not self._hashes:
+            raise ValueError("The hash ring has no shards")
+        index = bisect.bisect(self._hashes, _ring_hash(key)) % len(self._hashes)
+        return self._names[index]
+
+
+class ShardRouter:
+    """
+    Maps task owners to one of the shard databases.
+    The owner_shards directory in the main database is authoritative for known owners,
+    new owners are placed by the hash ring (or on the guest shard, if there is one).
+    With a single shard everything goes to the main engine and the directory is not used.
+    """
+    def __init__(
+        self,
+        shard_urls: dict,
+        guest_shard_url: Optional[str] = None,
+        draining: tuple = (),
+        virtual_nodes: int = settings.SHARD_VIRTUAL_NODES):
+        self.engines = {name: create_db_engine(url) for name, url in shard_urls.items()} or {MAIN_SHARD: engine}
+        if guest_shard_url:
+            self.engines[GUEST_SHARD] = create_db_engine(guest_shard_url)
+        self.guest_shard = GUEST_SHARD if guest_shard_url else None
+        self.sessionmakers = {
+            name: sessionmaker(autocommit=False, autoflush=False, bind=shard_engine)
+            for name, shard_engine in self.engines.items()}
+        self.ring = HashRing(
+            [name for name in self.engines if name not in draining and name != GUEST_SHARD], virtual_nodes)
+
+    @property
+    def is_sharded(self):
+        return len(self.engines) > 1
+
+    def create_all(self):
+        """
+        Creates the tables on every shard.
+        """
+        for shard_engine in self.engines.values():
+            Base.metadata.create_all(bind=shard_engine)
+
+    def session(self, shard: str):
+        """
+        Opens a new session on the shard.
+        """
+        return self.sessionmakers[shard]()
+
+    def place(self, user_id: Optional[int] = None, guest_id: Optional[str] = None):
+        """
+        Returns the shard a new owner belongs on, ignoring the directory.
+        """
+        if guest_id and self.guest_shard:
+            return self.guest_shard
+        return self.ring.get(owner_key(user_id, guest_id))
+
+    def shard_for(
+        self,
+        db: Session,
+        user_id: Optional[int] = None,
+        guest_id: Optional[str] = None,
+        assign: bool = False):
+        """
+        Returns the shard that stores the owner's tasks, looking it up in the directory.
+        With assign=True a new owner is written to the directory, so later ring changes do not move it.
+        Raises 503 while the owner's rows are being moved between shards.
+        """
+        if not self.is_sharded:
+            return next(iter(self.engines))
+
+        key = owner_key(user_id, guest_id)
+        placement = db.get(OwnerShard, key)
+        if placement is None:
+            shard = self.place(user_id, guest_id)
+            if not assign:
+                return shard
+            try:
+                db.add(OwnerShard(owner_key=key, shard=shard, moving=False))
+                db.commit()
+                return shard
+            except IntegrityError:
+                db.rollback()
+                placement = db.get(OwnerShard, key)
+
+        if placement.moving:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Your tasks are being moved, please retry in a moment",
+                headers={"Retry-After": "1"})
+        return placement.shard
+
+    def _max_task_id(self):
+        """
+        Returns the highest task id over all shards.
+        """
+        max_ids = []
+        for shard in self.engines:
+            shard_db = self.session(shard)
+            try:
+                max_ids.append(shard_db.execute(select(func.max(Task.id))).scalar() or 0)
+            finally:
+                shard_db.close()
+        return max(max_ids)
+
+    def allocate_task_ids(self, db: Session, count: int = 1):
+        """
+        Reserves count task ids that are unique over all shards and returns them as a range,
+        so tasks keep their ids when they are moved to another shard.
+        The sequence starts after the highest existing task id the first time it is used.
+        """
+        while True:
+            next_id = db.execute(
+                update(IdSequence)
+                .where(IdSequence.name == TASK_ID_SEQUENCE)
+                .values(next_id=IdSequence.next_id + count)
+                .returning(IdSequence.next_id)).scalar()
+            if next_id is not None:
+                db.commit()
+                return range(next_id - count, next_id)
+
+            db.rollback()
+            try:
+                db.add(IdSequence(name=TASK_ID_SEQUENCE, next_id=self._max_task_id() + 1))
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+
+
+shard_router = ShardRouter(settings.SHARD_DATABASES, settings.GUEST_SHARD_DATABASE, tuple(settings.SHARD_DRAINING))
+
+
+class ShardSessions:
+    """
+    Per-request pool of shard sessions. Sessions are opened on first use and closed with the request.
+    """
+    def __init__(self, db: Session, router: ShardRouter = shard_router):
+        self.db = db
+        self.router = router
+        self._sessions: dict[str, Session] = {}
+
+    def for_shard(self, shard: str):
+        """
+        Returns the request's session on the shard.
+        A shard on the main engine reuses the request session, so a request never holds two connections of one pool.
+        """
+        if self.router.engines[shard] is self.db.get_bind():
+            return self.db
+        if shard not in self._sessions:
+            self._sessions[shard] = self.router.session(shard)
+        return self._sessions[shard]
+
+    def for_owner(self, user_id: Optional[int] = None, guest_id: Optional[str] = None, assign: bool = False):
+        """
+        Returns the shard name and the request's session on the shard that stores the owner's tasks.
+        """
+        shard = self.router.shard_for(self.db, user_id, guest_id, assign)
+        return shard, self.for_shard(shard)
+
+    def allocate_task_ids(self, count: int = 1):
+        """
+        Returns count new task ids unique over all shards, or None with a single shard,
+        where the database gives the ids.
+        """
+        if not self.router.is_sharded:
+            return None
+        return self.router.allocate_task_ids(self.db, count)
+
+    def close(self):
+        for shard_db in self._sessions.values():
+            shard_db.close()
+        self._sessions.clear()
+
+
+def get_shard_sessions(db: Session = Depends(get_db)):
+    """
+    Yields the request's shard sessions and ensures they are closed after use.
+    """
+    shards = ShardSessions(db)
+    try:
+        yield shards
+    finally:
+        shards.close()
@@ -1,29 +1,59 @@
 from fastapi import WebSocket, WebSocketDisconnect, APIRouter
-from typing import List
+from fastapi.concurrency import run_in_threadpool
+from routers.tasks import active_timers, find_task_timer
+from typing import Dict, Optional
 import asyncio
+import itertools
+import math
+import time
 
 router = APIRouter(tags=["socket_manager"])
+COUNTDOWN_TICK_SECONDS = 1
+
+
+class TimerCountdown:
+    """
+    Compact state of one timer socket: its deadline (POSIX seconds) and, for task timers,
+    the (shard, task_id) key of the registry record it follows.
+    """
+    __slots__ = ("websocket", "deadline", "timer_key", "finish_handle")
+
+    def __init__(self, websocket: WebSocket, deadline: float, timer_key: Optional[tuple] = None):
+        self.websocket = websocket
+        self.deadline = deadline
+        self.timer_key = timer_key
+        self.finish_handle: Optional[asyncio.TimerHandle] = None
+
 
 class ConnectionManager:
     def __init__(self):
         """
-        Initializes the ConnectionManager with an empty list of active WebSocket connections.
+        Initializes the ConnectionManager with an empty connection_id -> WebSocket dict of active connections
+        and an empty connection_id -> TimerCountdown dict served by one shared ticker.
         """
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Dict[int, WebSocket] = {}
+        self.countdowns: Dict[int, TimerCountdown] = {}
+        self._connection_ids = itertools.count(1)
+        self._ticker: Optional[asyncio.Task] = None
+        self._finishing: set[asyncio.Task] = set()
 
     async def connect(self, websocket: WebSocket):
         """
-        Accepts a new WebSocket connection and adds it to the list of active connections.
+        Accepts a new WebSocket connection, adds it to the active connections and returns its id.
         """
         await websocket.accept()
-        self.active_connections.append(websocket)
+        connection_id = next(self._connection_ids)
+        self.active_connections[connection_id] = websocket
+        return connection_id
 
-    def disconnect(self, websocket: WebSocket):
+    def disconnect(self, connection_id: int):
         """
-        Removes a WebSocket connection from the list of active connections.
+        Removes a WebSocket connection and its countdown from the active connections.
         """
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        self.active_connections.pop(connection_id, None)
+        countdown = self.countdowns.pop(connection_id, None)
+        if countdown and countdown.finish_handle:
+            countdown.finish_handle.cancel()
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
         """
@@ -35,60 +65,123 @@ class ConnectionManager:
         """
         Sends a message to all active WebSocket connections.
         """
-        for connection in self.active_connections:
+        for connection in list(self.active_connections.values()):
             await connection.send_text(message)
 
+    def start_countdown(self, connection_id: int, websocket: WebSocket, deadline: float, timer_key: Optional[tuple] = None):
+        """
+        Adds the connection to the shared ticker and starts the ticker if it is not running in this event loop.
+        """
+        self.countdowns[connection_id] = TimerCountdown(websocket, deadline, timer_key)
+        loop = asyncio.get_running_loop()
+        if self._ticker is None or self._ticker.done() or self._ticker.get_loop() is not loop:
+            self._ticker = loop.create_task(self._tick())
+
+    def _follow_registry(self, countdown: TimerCountdown):
+        """
+        Picks up a new deadline of a restarted task timer from the registry.
+        Stopped and expired timers are gone from it, their countdown keeps the last deadline.
+        """
+        if countdown.timer_key:
+            timer = active_timers.get(*countdown.timer_key)
+            if timer is not None:
+                countdown.deadline = timer.deadline
+
+    async def _send(self, connection_id: int, websocket: WebSocket, message: str):
+        try:
+            await websocket.send_text(message)
+        except Exception:
+            self.disconnect(connection_id)
+
+    async def _tick(self):
+        """
+        Sends the remaining seconds to every timer socket once a second, while there are any.
+        A countdown that ends before the next tick gets a loop timer at its exact deadline.
+        """
+        loop = asyncio.get_running_loop()
+        while self.countdowns:
+            await asyncio.sleep(COUNTDOWN_TICK_SECONDS)
+            time_now = time.time()
+            sends = []
+            for connection_id, countdown in list(self.countdowns.items()):
+                self._follow_registry(countdown)
+                remaining = countdown.deadline - time_now
+                if remaining <= COUNTDOWN_TICK_SECONDS and countdown.finish_handle is None:
+                    countdown.finish_handle = loop.call_later(max(0.0, remaining), self._start_finish, connection_id)
+                if remaining > 0:
+                    sends.append(self._send(connection_id, countdown.websocket, str(math.ceil(remaining))))
+            if sends:
+                await asyncio.gather(*sends)
+
+    def _start_finish(self, connection_id: int):
+        """
+        Loop timer callback that runs _finish, keeping a reference to the task until it is done.
+        """
+        finish = asyncio.get_running_loop().create_task(self._finish(connection_id))
+        self._finishing.add(finish)
+        finish.add_done_callback(self._finishing.discard)
+
+    async def _finish(self, connection_id: int):
+        """
+        Sends TIMER_FINISHED and closes the socket, unless the task timer was restarted in the meantime.
+        """
+        countdown = self.countdowns.get(connection_id)
+        if countdown is None:
+            return None
+        self._follow_registry(countdown)
+        if countdown.deadline > time.time():
+            countdown.finish_handle = None
+            return None
+
+        self.countdowns.pop(connection_id, None)
+        try:
+            await countdown.websocket.send_text("TIMER_FINISHED")
+            await countdown.websocket.close()
+        except Exception:
+            self.disconnect(connection_id)
+
 manager = ConnectionManager()
 
-async def timer_websocket_endpoint(websocket: WebSocket, timer_seconds: int):
+async def timer_websocket_endpoint(websocket: WebSocket, deadline: float, timer_key: Optional[tuple] = None):
     """
-    Handles websocket connection for timer updates. Sends the remaining time every second.
+    Handles websocket connection for timer updates. Sends the remaining time right away,
+    then the shared ticker of the manager sends it every second and TIMER_FINISHED at the deadline.
+    The connection only waits for the client to disconnect, it does not wake up every second.
     """
+    connection_id = await manager.connect(websocket)
+
     try:
-        timer_seconds = int(timer_seconds)
-        if timer_seconds <= 0:
-            await websocket.close(code=1003, reason="Invalid timer duration (must be > 0)")
-            return
-    except ValueError as e:
-        await websocket.close(code=1003, reason=f"Invalid timer format: {e}")
+        await manager.send_personal_message(str(max(0, math.ceil(deadline - time.time()))), websocket)
+        manager.start_countdown(connection_id, websocket, deadline, timer_key)
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        manager.disconnect(connection_id)
+
+
+@router.websocket("/ws/timer/task/{task_id}")
+async def task_timer_websocket_endpoint(websocket: WebSocket, task_id: int):
+    """
+    WebSocket endpoint for a running task timer. The timer is looked up by task id in the timer registry,
+    so the countdown follows restarts and stays in sync with the server-side expiry.
+    """
+    timer = await run_in_threadpool(find_task_timer, websocket, task_id)
+    if timer is None:
+        await websocket.close(code=1008, reason="This task has no running timer")
         return
-        
-    await manager.connect(websocket)
-    
-    try:
-        await manager.send_personal_message(str(timer_seconds), websocket)
-        remaining = timer_seconds
-        while remaining > 0:
-            await asyncio.sleep(1)
-            remaining -= 1
-            if websocket in manager.active_connections:
-                await manager.send_personal_message(str(remaining), websocket)
-            else:
-                break
-                
-        if websocket in manager.active_connections:
-            await manager.send_personal_message("TIMER_FINISHED", websocket)
-    except WebSocketDisconnect:
-        manager.disconnect(websocket)
-    except Exception:
-        if websocket in manager.active_connections:
-            await manager.send_personal_message("ERROR", websocket)
-            manager.disconnect(websocket)
+
+    await timer_websocket_endpoint(websocket, timer.deadline, (timer.shard, timer.task_id))
 
 
 @router.websocket("/ws/timer/{timer_seconds}")
 async def websocket_endpoint(websocket: WebSocket, timer_seconds: int):
     """
-    WebSocket endpoint for timer. Validates the timer and delegates to the timer handler.
+    WebSocket endpoint for a plain timer of the given duration.
     """
-    try:
-        if timer_seconds <= 0:
-            await websocket.close(code=1003, reason="Invalid timer duration")
-            return
+    if timer_seconds <= 0:
+        await websocket.close(code=1003, reason="Invalid timer duration (must be > 0)")
+        return
 
-        await timer_websocket_endpoint(websocket, timer_seconds)
-    except ValueError as e:
-        try:
-            await websocket.close(code=1003, reason=str(e))
-        except Exception:
-            pass
+    await timer_websocket_endpoint(websocket, time.time() + timer_seconds)
@@ -19,6 +19,23 @@ const AUTH_API = `${API_URL}/auth`;
 // Track active WebSocket connections per task
 const activeTimerSockets = {};
 
+// Idempotency keys of in-progress actions, reused on double submits and retries
+const pendingIdempotencyKeys = {};
+
+function idempotencyKey(action) {
+    if (!pendingIdempotencyKeys[action]) {
+        pendingIdempotencyKeys[action] = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    }
+    return pendingIdempotencyKeys[action];
+}
+
+// Called once the server answered, so the next action gets a new key
+function releaseIdempotencyKey(action) {
+    delete pendingIdempotencyKeys[action];
+}
+
 // Home Page Initialization
 function initHomePage() {
     console.log('Home page initialized');
@@ -188,13 +205,16 @@ function initTasksPage() {
         try {
             const response = await fetch(TASKS_API, {
                 method: 'POST',
-                headers: {'Content-Type': 'application/json'},
+                headers: {'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey('add-task')},
                 body: JSON.stringify(taskData)
             });
+            releaseIdempotencyKey('add-task');
             
             if (!response.ok) throw new Error('Failed to add task');
             
             const newTask = await response.json();
+            // A double submit gets the same task back, render it only once
+            if (document.querySelector(`.task-item[data-task-id="${newTask.id}"]`)) return;
             const taskElement = createTaskElement(newTask);
             
             // Remove empty message if it exists
@@ -270,9 +290,10 @@ function initTasksPage() {
             // Fix URL with trailing slash
             const response = await fetch(`${TASKS_API}/${taskId}/`, {
                 method: 'PUT',
-                headers: {'Content-Type': 'application/json'},
+                headers: {'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey(`edit-task-${taskId}`)},
                 body: JSON.stringify(taskData)
             });
+            releaseIdempotencyKey(`edit-task-${taskId}`);
             
             if (!response.ok) throw new Error('Failed to update task');
             
@@ -298,8 +319,10 @@ function initTasksPage() {
     async function startTimer(taskId) {
         try {
             const response = await fetch(`${TASKS_API}/${taskId}/timer_start/`, {
-                method: 'PUT'
+                method: 'PUT',
+                headers: {'Idempotency-Key': idempotencyKey(`timer-start-${taskId}`)}
             });
+            releaseIdempotencyKey(`timer-start-${taskId}`);
             
             if (!response.ok) {
                 console.error('Failed to start timer:', response.status, response.statusText);
@@ -325,8 +348,10 @@ function initTasksPage() {
     async function stopTimer(taskId) {
         try {
             const response = await fetch(`${TASKS_API}/${taskId}/timer_stop/`, {
-                method: 'PUT'
+                method: 'PUT',
+                headers: {'Idempotency-Key': idempotencyKey(`timer-stop-${taskId}`)}
             });
+            releaseIdempotencyKey(`timer-stop-${taskId}`);
             
             if (!response.ok) {
                 console.error('Failed to stop timer:', response.status, response.statusText);
@@ -360,9 +385,10 @@ function initTasksPage() {
             // Fix URL with trailing slash
             const response = await fetch(`${TASKS_API}/${taskId}/`, {
                 method: 'PUT',
-                headers: {'Content-Type': 'application/json'},
+                headers: {'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey(`complete-task-${taskId}`)},
                 body: JSON.stringify({ is_completed: isCompleted })
             });
+            releaseIdempotencyKey(`complete-task-${taskId}`);
             
             if (!response.ok) {
                 console.error('Failed to update task completion:', response.status, response.statusText);
@@ -393,7 +419,8 @@ function initTasksPage() {
         console.log(`Creating WebSocket connection for timer with duration: ${duration} seconds`);
         // Use wss:// for HTTPS, ws:// for HTTP
         const wsProtocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
-        const ws = new WebSocket(`${wsProtocol}://${window.location.host}/ws/timer/${Math.floor(duration)}`);
+        // The server looks the running timer up by task id, so the countdown survives restarts of the timer
+        const ws = new WebSocket(`${wsProtocol}://${window.location.host}/ws/timer/task/${taskId}`);
         activeTimerSockets[taskId] = ws;
         
         // Show connecting status
@@ -0,0 +1,185 @@
+from sqlalchemy import insert, select, update, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import Task, TimerSessionLog, DailyStats
+from datetime import datetime, date
+from typing import Optional
+
+STATS_FIELDS = ("focus_seconds", "tasks_completed", "timers_finished", "timers_aborted")
+
+TIMER_STARTED = "started"
+TIMER_FINISHED = "finished"
+TIMER_ABORTED = "aborted"
+
+
+def _owner_stats_filter(user_id: Optional[int] = None, guest_id: Optional[str] = None):
+    """
+    Builds the daily stats filter of a user or guest.
+    """
+    if guest_id:
+        return DailyStats.guest_id == guest_id
+    elif user_id:
+        return DailyStats.user_id == user_id
+    else:
+        raise ValueError("Provide user_id or guest_id - at least one field is mandatory")
+
+
+def _owner_stats_query(db: Session, user_id: Optional[int] = None, guest_id: Optional[str] = None):
+    """
+    Builds the daily stats query scoped to a user or guest.
+    """
+    return db.query(DailyStats).filter(_owner_stats_filter(user_id, guest_id))
+
+
+def _create_day_row(db: Session, user_id: Optional[int], guest_id: Optional[str], day: date):
+    """
+    Inserts the owner's row of the day with the latest earlier totals, unless another transaction already did.
+    The unique (owner, day) indexes make the insert a no-op for the loser of a race.
+    """
+    owner_filter = _owner_stats_filter(user_id, guest_id)
+    totals = {
+        field: func.coalesce(
+            select(getattr(DailyStats, field))
+            .where(owner_filter, DailyStats.day < day)
+            .order_by(DailyStats.day.desc())
+            .limit(1)
+            .scalar_subquery(), 0)
+        for field in STATS_FIELDS}
+    values = {"user_id": user_id, "guest_id": guest_id, "day": day, **totals}
+
+    dialect_insert = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}.get(db.get_bind().dialect.name)
+    if dialect_insert:
+        db.execute(dialect_insert(DailyStats).values(values).on_conflict_do_nothing())
+    else:
+        try:
+            with db.begin_nested():
+                db.execute(insert(DailyStats).values(values))
+        except IntegrityError:
+            pass
+
+
+def update_daily_stats(db: Session, user_id: Optional[int] = None, guest_id: Optional[str] = None, **deltas: int):
+    """
+    Adds the deltas to today's running totals of the owner with an atomic UPDATE ... SET col = col + delta,
+    so concurrent requests and the scheduler thread never overwrite each other's counts.
+    Creates today's row from the latest totals if the owner had no activity today yet.
+    Does not commit - the caller commits together with the change that produced the stats.
+    """
+    for field in deltas:
+        if field not in STATS_FIELDS:
+            raise ValueError(f"Unknown stats field: {field}")
+
+    today = datetime.now().date()
+    statement = (
+        update(DailyStats)
+        .where(_owner_stats_filter(user_id, guest_id), DailyStats.day == today)
+        .values({field: getattr(DailyStats, field) + delta for field, delta in deltas.items()})
+        .execution_options(synchronize_session=False))
+
+    if db.execute(statement).rowcount == 0:
+        _create_day_row(db, user_id, guest_id, today)
+        db.execute(statement)
+    return None
+
+
+def _focus_seconds(task: Task, end_time: datetime):
+    """
+    Counts how many seconds of the task timer were actually spent, capped by the timer lenght.
+    """
+    if not task.timer_start:
+        return 0
+    spent = int((end_time - task.timer_start.replace(tzinfo=None)).total_seconds())
+    return max(0, min(spent, task.timer_lenght or spent))
+
+
+def log_timer_event(db: Session, task: Task, event: str):
+    """
+    Appends a timer event of the task to the session log and rolls it up into the daily stats.
+    Must be called before the task timer fields are overwritten.
+    Does not commit - the caller commits together with the timer change.
+    """
+    time_now = datetime.now()
+    focus_seconds = 0 if event == TIMER_STARTED else _focus_seconds(task, time_now)
+
+    db.add(TimerSessionLog(
+        task_id = task.id,
+        user_id = task.user_id,
+        guest_id = task.guest_id,
+        event = event,
+        event_time = time_now,
+        focus_seconds = focus_seconds))
+
+    if event == TIMER_FINISHED:
+        update_daily_stats(db, task.user_id, task.guest_id, focus_seconds=focus_seconds, timers_finished=1)
+    elif event == TIMER_ABORTED:
+        update_daily_stats(db, task.user_id, task.guest_id, focus_seconds=focus_seconds, timers_aborted=1)
+
+
+def log_finished_timers(db: Session, timers: list, time_now: datetime):
+    """
+    Appends the finished events of expired timers (ActiveTimer records) with one executemany
+    and rolls them up into the daily stats with one update per owner.
+    Does not commit - the caller commits together with the timer change.
+    """
+    rows = []
+    owners_stats = {}
+    for timer in timers:
+        focus_seconds = max(0, int(timer.deadline - timer.started))
+        rows.append({
+            "task_id": timer.task_id,
+            "user_id": timer.user_id,
+            "guest_id": timer.guest_id,
+            "event": TIMER_FINISHED,
+            "event_time": time_now,
+            "focus_seconds": focus_seconds})
+        owner_stats = owners_stats.setdefault((timer.user_id, timer.guest_id), {"focus_seconds": 0, "timers_finished": 0})
+        owner_stats["focus_seconds"] += focus_seconds
+        owner_stats["timers_finished"] += 1
+
+    db.execute(insert(TimerSessionLog), rows)
+    for (user_id, guest_id), owner_stats in owners_stats.items():
+        update_daily_stats(db, user_id, guest_id, **owner_stats)
+
+
+def count_task_completion(db: Session, task: Task, is_completed: bool):
+    """
+    Adds or takes back the task's completion in the daily stats.
+    Only completions counted here are taken back: completed_at marks them, so tasks that were imported
+    or completed before the stats existed never make tasks_completed negative. The conditional UPDATEs
+    let only one of several concurrent requests count the change.
+    Does not set is_completed or commit - the caller does both together.
+    """
+    statement = update(Task).where(Task.id == task.id).execution_options(synchronize_session=False)
+    if is_completed:
+        statement = statement.where(Task.completed_at.is_(None), Task.is_completed.is_not(True))
+        completed_at, delta = datetime.now(), 1
+    else:
+        statement = statement.where(Task.completed_at.is_not(None))
+        completed_at, delta = None, -1
+
+    if db.execute(statement.values(completed_at=completed_at)).rowcount:
+        update_daily_stats(db, task.user_id, task.guest_id, tasks_completed=delta)
+
+
+def get_stats_for_range(
+    db: Session,
+    date_from: date,
+    date_to: date,
+    user_id: Optional[int] = None,
+    guest_id: Optional[str] = None):
+    """
+    Returns the owner's stats totals for the inclusive date range.
+    Reads only two rollup rows, no matter how much history the owner has.
+    """
+    owner_query = _owner_stats_query(db, user_id, guest_id)
+    until_end = owner_query.filter(DailyStats.day <= date_to).order_by(DailyStats.day.desc()).first()
+    before_start = owner_query.filter(DailyStats.day < date_from).order_by(DailyStats.day.desc()).first()
+
+    stats = {"date_from": date_from, "date_to": date_to}
+    for field in STATS_FIELDS:
+        total = getattr(until_end, field) if until_end else 0
+        previous = getattr(before_start, field) if before_start else 0
+        stats[field] = total - previous
+
+    return stats
@@ -0,0 +1,95 @@
+import heapq
+import threading
+from typing import Optional
+
+
+class ActiveTimer:
+    """
+    Compact in-memory record of one running task timer.
+    Timestamps are POSIX seconds (floats), not datetimes, to keep the record small.
+    Task ids are unique per shard only, so the shard name is part of the record.
+    """
+    __slots__ = ("shard", "task_id", "user_id", "guest_id", "started", "deadline")
+
+    def __init__(
+        self,
+        shard: str,
+        task_id: int,
+        user_id: Optional[int],
+        guest_id: Optional[str],
+        started: float,
+        deadline: float):
+        self.shard = shard
+        self.task_id = task_id
+        self.user_id = user_id
+        self.guest_id = guest_id
+        self.started = started
+        self.deadline = deadline
+
+
+class TimerRegistry:
+    """
+    Holds the running task timers of this process, indexed by (shard, task id) and by deadline.
+    Request handlers and the scheduler thread both use it, so every access is locked.
+    """
+    def __init__(self):
+        """
+        Initializes an empty registry: a (shard, task_id) -> ActiveTimer dict and a heap of (deadline, shard, task_id).
+        """
+        self._timers: dict[tuple[str, int], ActiveTimer] = {}
+        self._deadlines: list[tuple[float, str, int]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._timers)
+
+    def __contains__(self, key: tuple[str, int]):
+        return key in self._timers
+
+    def get(self, shard: str, task_id: int):
+        """
+        Returns the running timer of the task or None.
+        """
+        return self._timers.get((shard, task_id))
+
+    def add(
+        self,
+        shard: str,
+        task_id: int,
+        user_id: Optional[int],
+        guest_id: Optional[str],
+        started: float,
+        deadline: float):
+        """
+        Adds a timer or replaces the running timer of the same task.
+        The old heap entry is left behind and skipped when it comes up.
+        """
+        timer = ActiveTimer(shard, task_id, user_id, guest_id, started, deadline)
+        with self._lock:
+            self._timers[(shard, task_id)] = timer
+            heapq.heappush(self._deadlines, (deadline, shard, task_id))
+            if len(self._deadlines) > 2 * len(self._timers) + 64:
+                self._deadlines = [(timer.deadline, timer.shard, timer.task_id) for timer in self._timers.values()]
+                heapq.heapify(self._deadlines)
+        return timer
+
+    def remove(self, shard: str, task_id: int):
+        """
+        Removes the running timer of the task and returns it, or None if there was none.
+        """
+        with self._lock:
+            return self._timers.pop((shard, task_id), None)
+
+    def pop_expired(self, now: float):
+        """
+        Removes and returns all timers with a deadline at or before now, earliest first.
+        """
+        expired = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                deadline, shard, task_id = heapq.heappop(self._deadlines)
+                timer = self._timers.get((shard, task_id))
+                if timer is not None and timer.deadline == deadline:
+                    del self._timers[(shard, task_id)]
+                    expired.append(timer)
+        return expired
@@ -0,0 +1,64 @@
+"""
+Shared test setup. The app reads its settings when it is imported, so the environment is prepared first:
+plain HTTP cookies, no shards and the DEBUG database in a temporary directory instead of the relative
+db.sqlite3 (SQLAlchemy fixes that path when the engine is created, so it is set before the app is imported).
+Tests that need their own databases use temporary SQLite files from the fixtures below.
+"""
+import os
+import shutil
+import tempfile
+
+os.environ["DEBUG"] = "True"
+os.environ["COOKIE_SECURE"] = "False"
+for name in ("SHARD_DATABASES", "SHARD_DRAINING", "GUEST_SHARD_DATABASE", "IDEMPOTENCY_STORE"):
+    os.environ.pop(name, None)
+
+import settings
+
+APP_DATABASE_DIR = tempfile.mkdtemp(prefix="fast-task-tracker-tests-")
+settings.DATABASE = f"sqlite:///{APP_DATABASE_DIR}/db.sqlite3"
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+import models  # noqa: F401 - registers the tables
+from database import Base, create_db_engine
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(APP_DATABASE_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    """
+    Returns a function that gives the URL of a new temporary SQLite file.
+    """
+    def make(name: str = "test"):
+        return f"sqlite:///{tmp_path / name}.sqlite3"
+    return make
+
+
+@pytest.fixture
+def session_factory(sqlite_url):
+    """
+    Sessionmaker of a temporary SQLite database with all tables.
+    """
+    engine = create_db_engine(sqlite_url())
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def client():
+    """
+    Test client of the app as one guest. The first request creates the guest session cookie.
+    The client is entered, so concurrent requests share one event loop like on a real server.
+    """
+    from main import app
+
+    with TestClient(app, base_url="https://testserver") as client:
+        client.post("/api/tasks/", json={"title": "First task"})
+        yield client
@@ -0,0 +1,104 @@
+import asyncio
+import gzip
+import json
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+GZIP = {"Accept-Encoding": "gzip"}
+IMPORTED_TASKS = 3000
+
+
+@pytest.fixture(scope="module")
+def owner(client):
+    """
+    A guest of its own with enough tasks for a multi-batch export.
+    """
+    owner = TestClient(client.app, base_url="https://testserver")
+    body = "".join(json.dumps({"title": f"Task {number}", "description": "x" * 50}) + "\n" for number in range(IMPORTED_TASKS))
+    assert owner.post("/api/tasks/import?format=ndjson", content=body.encode()).json()["imported"] == IMPORTED_TASKS
+    return owner
+
+
+def test_large_response_is_gzipped(owner):
+    response = owner.get("/api/tasks/", headers=GZIP)
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == IMPORTED_TASKS
+
+
+def test_small_response_is_sent_as_it_is(owner):
+    response = owner.get("/api/tasks/server-time", headers=GZIP)
+
+    assert "content-encoding" not in response.headers
+
+
+def test_png_is_not_gzipped(owner):
+    response = owner.get("/static/imgs/duck.png", headers=GZIP)
+
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.content.startswith(b"\x89PNG")
+
+
+def _asgi_get(app, path: str, query_string: bytes, headers: list):
+    """
+    Runs a GET through the ASGI app and returns every message it sent. The test client would join the body.
+    """
+    messages = []
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "https",
+        "path": path, "raw_path": path.encode(), "query_string": query_string, "root_path": "",
+        "headers": [(b"host", b"testserver"), *headers],
+        "client": ("testclient", 50000), "server": ("testserver", 443)}
+
+    async def run():
+        request_sent = False
+        response_sent = asyncio.Event()
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # Like a server, the client only disconnects once the response is complete
+            await response_sent.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_sent.set()
+
+        await app(scope, receive, send)
+
+    asyncio.run(run())
+    return messages
+
+
+def test_export_is_gzipped_and_streamed(owner):
+    cookie = "; ".join(f"{name}={value}" for name, value in owner.cookies.items())
+
+    start, *bodies = _asgi_get(
+        owner.app, "/api/tasks/export", b"format=ndjson", [(b"accept-encoding", b"gzip"), (b"cookie", cookie.encode())])
+
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    assert sum(bool(message["body"]) for message in bodies) > 1
+    assert [message.get("more_body", False) for message in bodies][-1] is False
+    lines = gzip.decompress(b"".join(message["body"] for message in bodies)).decode().splitlines()
+    assert len(lines) == IMPORTED_TASKS
+
+
+def test_idempotent_replay_is_gzipped(owner):
+    headers = {**GZIP, "Idempotency-Key": str(uuid.uuid4())}
+    task = {"title": "Long task", "description": "y" * 2000}
+
+    first = owner.post("/api/tasks/", json=task, headers=headers)
+    replay = owner.post("/api/tasks/", json=task, headers=headers)
+
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert first.headers["content-encoding"] == replay.headers["content-encoding"] == "gzip"
+    assert replay.json() == first.json()
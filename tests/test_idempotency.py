@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import PlainTextResponse
+
+from idempotency import DatabaseIdempotencyStore, IdempotencyCache, IdempotencyMiddleware, MemoryIdempotencyStore
+
+KEY = ("caller", "POST", "/api/tasks", "key")
+HEADERS = [(b"content-type", b"application/json")]
+
+
+def _tasks_count(client):
+    return len(client.get("/api/tasks/").json())
+
+
+def test_retry_replays_first_response(client):
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    tasks_before = _tasks_count(client)
+
+    first = client.post("/api/tasks/", json={"title": "Once"}, headers=headers)
+    retry = client.post("/api/tasks/", json={"title": "Once"}, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert "idempotent-replayed" not in first.headers
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json() == first.json()
+    assert _tasks_count(client) == tasks_before + 1
+
+
+def test_key_reused_for_another_body_is_rejected(client):
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    client.post("/api/tasks/", json={"title": "Original"}, headers=headers)
+
+    response = client.post("/api/tasks/", json={"title": "Changed"}, headers=headers)
+
+    assert response.status_code == 422
+
+
+def test_concurrent_retries_run_the_request_once(client):
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    tasks_before = _tasks_count(client)
+
+    with ThreadPoolExecutor(8) as executor:
+        responses = list(executor.map(
+            lambda _: client.post("/api/tasks/", json={"title": "Double submit"}, headers=headers), range(8)))
+
+    assert {response.json()["id"] for response in responses} == {responses[0].json()["id"]}
+    assert sum("idempotent-replayed" not in response.headers for response in responses) == 1
+    assert _tasks_count(client) == tasks_before + 1
+
+
+def test_replay_survives_outer_middleware_rewriting_headers():
+    calls = []
+
+    async def endpoint(scope, receive, send):
+        calls.append(scope["path"])
+        await PlainTextResponse("z" * 2000)(scope, receive, send)
+
+    store = MemoryIdempotencyStore(IdempotencyCache(max_keys=100, ttl_seconds=60))
+    # GZipMiddleware sets Content-Encoding and Content-Length in the sent headers list itself
+    app = GZipMiddleware(IdempotencyMiddleware(endpoint, store), minimum_size=100)
+    client = TestClient(app)
+    headers = {"Idempotency-Key": "key", "Accept-Encoding": "gzip"}
+
+    first = client.post("/api/tasks/", headers=headers)
+    replay = client.post("/api/tasks/", headers=headers)
+
+    assert len(calls) == 1
+    assert first.headers["content-encoding"] == replay.headers["content-encoding"] == "gzip"
+    assert replay.text == first.text == "z" * 2000
+
+
+@pytest.fixture(params=["memory", "database"])
+def store(request, session_factory):
+    if request.param == "memory":
+        return MemoryIdempotencyStore(IdempotencyCache(max_keys=100, ttl_seconds=60))
+    return DatabaseIdempotencyStore(session_factory, poll_seconds=0.01)
+
+
+def test_store_replays_finished_response(store):
+    async def scenario():
+        assert await store.claim(KEY) is None
+        await store.finish(KEY, b"fingerprint", 201, HEADERS, b"{}")
+        return await store.claim(KEY)
+
+    stored = asyncio.run(scenario())
+
+    assert (stored.fingerprint, stored.status, stored.headers, stored.body) == (b"fingerprint", 201, HEADERS, b"{}")
+
+
+def test_store_forgets_failed_response(store):
+    async def scenario():
+        assert await store.claim(KEY) is None
+        await store.finish(KEY, b"fingerprint", 500, HEADERS, b"{}")
+        return await store.claim(KEY)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_store_retry_waits_for_running_request(store):
+    async def first_request():
+        assert await store.claim(KEY) is None
+        await asyncio.sleep(0.1)
+        await store.finish(KEY, b"fingerprint", 200, HEADERS, b"first")
+        return "ran"
+
+    async def retry():
+        await asyncio.sleep(0.01)
+        stored = await store.claim(KEY)
+        return stored.body
+
+    async def scenario():
+        return await asyncio.gather(first_request(), retry(), retry())
+
+    assert asyncio.run(scenario()) == ["ran", b"first", b"first"]
+
+
+def test_database_store_is_shared_between_workers(session_factory):
+    runs = []
+    results = []
+
+    def worker():
+        store = DatabaseIdempotencyStore(session_factory, poll_seconds=0.01)
+
+        async def request():
+            stored = await store.claim(KEY)
+            if stored is None:
+                runs.append(threading.get_ident())
+                await asyncio.sleep(0.2)
+                await store.finish(KEY, b"fingerprint", 200, HEADERS, b"first")
+                return b"first"
+            return stored.body
+
+        results.append(asyncio.run(request()))
+
+    workers = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    assert len(runs) == 1
+    assert results == [b"first"] * 4
+
+
+def test_database_store_frees_key_of_crashed_request(session_factory):
+    store = DatabaseIdempotencyStore(session_factory, pending_seconds=0, poll_seconds=0.01)
+
+    async def scenario():
+        assert await store.claim(KEY) is None
+        # The first request never finishes, its pending row expires right away
+        return await store.claim(KEY)
+
+    assert asyncio.run(scenario()) is None
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+
+from routers.tasks import ImportRecordTooLarge, _ImportRecordSplitter, _read_import_rows
+
+
+class StreamedRequest:
+    """
+    Stand-in for a request whose body arrives in the given chunks.
+    """
+    def __init__(self, chunks: list):
+        self.chunks = chunks
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def _read_rows(chunks: list, import_format: str):
+    async def read():
+        return [row async for row in _read_import_rows(StreamedRequest(chunks), import_format)]
+    return asyncio.run(read())
+
+
+def _split(text: str, import_format: str, chunk_size: int, max_record_size: int = 1000):
+    splitter = _ImportRecordSplitter(import_format, max_record_size)
+    records = []
+    for start in range(0, len(text), chunk_size):
+        records += splitter.feed(text[start:start + chunk_size])
+    return records + splitter.finish()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 1000])
+def test_csv_records_do_not_depend_on_chunks(chunk_size):
+    text = 'title,description\r\n"Multi\nline",plain\n"Quote ""x""",\n'
+
+    assert _split(text, "csv", chunk_size) == [
+        "title,description", '"Multi\nline",plain', '"Quote ""x""",', ""]
+
+
+def test_ndjson_quotes_do_not_join_lines():
+    assert _split('{"title": "a\\"}\n{"title": "b"}', "ndjson", 3) == ['{"title": "a\\"}', '{"title": "b"}']
+
+
+def test_csv_rows_are_mapped_to_the_header():
+    body = 'title,description,timer_lenght\n"Two\nlines",,60\nPlain,Text,\n'.encode()
+
+    rows = _read_rows([body[:9], body[9:20], body[20:]], "csv")
+
+    assert rows == [
+        {"title": "Two\nlines", "timer_lenght": "60"},
+        {"title": "Plain", "description": "Text"}]
+
+
+def test_ndjson_bad_records_are_yielded_as_none():
+    body = '{"title": "ok"}\nnot json\n[1, 2]\n\n{"title": "last"}'.encode()
+
+    assert _read_rows([body], "ndjson") == [{"title": "ok"}, None, None, {"title": "last"}]
+
+
+def test_multibyte_characters_split_between_chunks():
+    body = '{"title": "Zadanie żółw"}\n'.encode()
+    split = body.index("ż".encode()) + 1
+
+    assert _read_rows([body[:split], body[split:]], "ndjson") == [{"title": "Zadanie żółw"}]
+
+
+def test_unclosed_quote_is_rejected_in_linear_time():
+    splitter = _ImportRecordSplitter("csv", max_record_size=100_000)
+    chunk = "x\n" * 500
+
+    started = time.perf_counter()
+    with pytest.raises(ImportRecordTooLarge):
+        splitter.feed('title\n"never closed')
+        for _ in range(10_000):
+            splitter.feed(chunk)
+    assert time.perf_counter() - started < 1
+
+
+def test_long_record_is_rejected():
+    with pytest.raises(ImportRecordTooLarge):
+        _split('{"title": "' + "x" * 2000 + '"}\n', "ndjson", 100)
+
+
+def test_import_endpoint_counts_imported_and_skipped(client):
+    body = '{"title": "Imported"}\n{"title": "Bad", "timer_lenght": "soon"}\nbroken\n{"title": "Imported too", "timer_lenght": 60}\n'
+
+    response = client.post("/api/tasks/import?format=ndjson", content=body.encode())
+
+    assert response.status_code == 200
+    assert response.json()["imported"] == 2
+    assert response.json()["skipped"] == 2
@@ -0,0 +1,224 @@
+import threading
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.orm import sessionmaker
+
+import shard_rebalance
+from database import create_db_engine
+from models import IdSequence, OwnerShard, Task, TimerSessionLog
+from shard_rebalance import MoveSkipped, move_owner
+from sharding import GUEST_SHARD, HashRing, ShardRouter
+
+KEYS = [f"user:{user_id}" for user_id in range(4000)]
+
+
+@pytest.fixture
+def router(sqlite_url):
+    router = ShardRouter({"a": sqlite_url("a"), "b": sqlite_url("b")}, virtual_nodes=64)
+    router.create_all()
+    yield router
+    for engine in router.engines.values():
+        engine.dispose()
+
+
+@pytest.fixture
+def directory(sqlite_url, router):
+    """
+    Session of the main database with the owner directory and the task id sequence.
+    """
+    engine = create_db_engine(sqlite_url("main"))
+    OwnerShard.__table__.create(bind=engine)
+    IdSequence.__table__.create(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield db
+    db.close()
+    engine.dispose()
+
+
+def _task_ids(router, shard, user_id=None):
+    shard_db = router.session(shard)
+    try:
+        query = select(Task.id).order_by(Task.id)
+        if user_id:
+            query = query.where(Task.user_id == user_id)
+        return shard_db.execute(query).scalars().all()
+    finally:
+        shard_db.close()
+
+
+def _add_tasks(router, shard, user_id, titles, task_ids=None):
+    shard_db = router.session(shard)
+    task_ids = task_ids or [None] * len(titles)
+    shard_db.add_all(Task(id=task_id, title=title, user_id=user_id) for task_id, title in zip(task_ids, titles))
+    shard_db.commit()
+    shard_db.close()
+
+
+def test_ring_placement_is_stable_and_uses_every_shard():
+    ring = HashRing(["a", "b", "c"], virtual_nodes=64)
+    same_ring = HashRing(["c", "a", "b"], virtual_nodes=64)
+
+    placements = [ring.get(key) for key in KEYS]
+
+    assert placements == [same_ring.get(key) for key in KEYS]
+    for shard in ("a", "b", "c"):
+        assert 0.2 < placements.count(shard) / len(KEYS) < 0.47
+
+
+def test_adding_a_shard_moves_about_one_nth_of_the_owners():
+    before = HashRing(["a", "b", "c"], virtual_nodes=64)
+    after = HashRing(["a", "b", "c", "d"], virtual_nodes=64)
+
+    moved = [key for key in KEYS if before.get(key) != after.get(key)]
+
+    assert 0.15 < len(moved) / len(KEYS) < 0.35
+    assert {after.get(key) for key in moved} == {"d"}
+
+
+def test_guests_and_draining_shards(sqlite_url):
+    router = ShardRouter(
+        {"a": sqlite_url("a"), "b": sqlite_url("b")}, guest_shard_url=sqlite_url("guests"), draining=("b",))
+
+    assert router.place(guest_id="guest") == GUEST_SHARD
+    assert {router.place(user_id=user_id) for user_id in range(1, 200)} == {"a"}
+
+
+def test_directory_pins_owners_and_blocks_moving_ones(directory, router, sqlite_url):
+    shard = router.shard_for(directory, user_id=7, assign=True)
+    grown = ShardRouter({"a": sqlite_url("a"), "b": sqlite_url("b"), "c": sqlite_url("c")})
+
+    assert grown.shard_for(directory, user_id=7) == shard
+
+    directory.get(OwnerShard, "user:7").moving = True
+    directory.commit()
+    with pytest.raises(HTTPException) as error:
+        router.shard_for(directory, user_id=7)
+    assert error.value.status_code == 503
+
+
+def test_task_ids_are_unique_over_shards(directory, router):
+    _add_tasks(router, "a", 1, ["old"] * 3)
+    _add_tasks(router, "b", 2, ["old"] * 5)
+    task_ids = []
+    sessions = sessionmaker(autocommit=False, autoflush=False, bind=directory.get_bind())
+
+    def allocate():
+        db = sessions()
+        try:
+            for _ in range(10):
+                task_ids.extend(router.allocate_task_ids(db, 3))
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=allocate) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(task_ids)) == len(task_ids) == 6 * 10 * 3
+    assert min(task_ids) == 6
+
+
+def _pin(directory, user_id, shard):
+    directory.add(OwnerShard(owner_key=f"user:{user_id}", shard=shard, moving=False))
+    directory.commit()
+
+
+def test_move_keeps_task_ids_and_empties_the_source(directory, router):
+    _add_tasks(router, "a", 1, ["one", "two"], task_ids=[11, 12])
+    _add_tasks(router, "a", 2, ["other owner"], task_ids=[13])
+    source_db = router.session("a")
+    source_db.add(TimerSessionLog(task_id=11, user_id=1, event="finished", focus_seconds=60))
+    source_db.commit()
+    source_db.close()
+    _pin(directory, 1, "a")
+
+    assert move_owner(directory, router, "a", "b", user_id=1, grace_seconds=0) == 2
+
+    assert _task_ids(router, "b", user_id=1) == [11, 12]
+    assert _task_ids(router, "a") == [13]
+    target_db = router.session("b")
+    assert target_db.execute(select(TimerSessionLog.task_id)).scalars().all() == [11]
+    target_db.close()
+    placement = directory.get(OwnerShard, "user:1")
+    directory.refresh(placement)
+    assert (placement.shard, placement.moving) == ("b", False)
+
+
+def test_owner_without_directory_entry_is_not_moved(directory, router):
+    _add_tasks(router, "a", 1, ["one"], task_ids=[1])
+
+    with pytest.raises(MoveSkipped):
+        move_owner(directory, router, "a", "b", user_id=1, grace_seconds=0)
+
+    assert _task_ids(router, "a") == [1]
+
+
+def test_owner_with_running_timer_is_not_moved(directory, router):
+    _add_tasks(router, "a", 1, ["one"], task_ids=[1])
+    source_db = router.session("a")
+    source_db.execute(update(Task).values(timer_active=True))
+    source_db.commit()
+    source_db.close()
+    _pin(directory, 1, "a")
+
+    with pytest.raises(MoveSkipped):
+        move_owner(directory, router, "a", "b", user_id=1, grace_seconds=0)
+
+    assert _task_ids(router, "a") == [1]
+    assert _task_ids(router, "b") == []
+
+
+@pytest.mark.parametrize("concurrent_write", ["insert", "update", "delete"])
+def test_write_during_move_is_not_lost(directory, router, monkeypatch, concurrent_write):
+    """
+    A request that read the directory before the owner was marked as moving writes to the source
+    from its own connection after the rows were copied. The move must back off and keep that write.
+    """
+    _add_tasks(router, "a", 1, ["one", "two"], task_ids=[1, 2])
+    _pin(directory, 1, "a")
+    copy_owner_rows = shard_rebalance._copy_owner_rows
+
+    def copy_then_write(source_db, target_db, user_id, guest_id):
+        copied = copy_owner_rows(source_db, target_db, user_id, guest_id)
+        request_db = router.session("a")
+        if concurrent_write == "insert":
+            request_db.add(Task(id=3, title="late", user_id=1))
+        elif concurrent_write == "update":
+            request_db.execute(update(Task).where(Task.id == 2).values(title="edited"))
+        else:
+            request_db.delete(request_db.get(Task, 2))
+        request_db.commit()
+        request_db.close()
+        return copied
+
+    monkeypatch.setattr(shard_rebalance, "_copy_owner_rows", copy_then_write)
+
+    with pytest.raises(MoveSkipped):
+        move_owner(directory, router, "a", "b", user_id=1, grace_seconds=0)
+
+    expected = {"insert": [1, 2, 3], "update": [1, 2], "delete": [1]}[concurrent_write]
+    assert _task_ids(router, "a") == expected
+    assert _task_ids(router, "b") == []
+    if concurrent_write == "update":
+        source_db = router.session("a")
+        assert source_db.get(Task, 2).title == "edited"
+        source_db.close()
+    placement = directory.get(OwnerShard, "user:1")
+    directory.refresh(placement)
+    assert (placement.shard, placement.moving) == ("a", False)
+
+
+def test_taken_task_ids_stop_the_move(directory, router):
+    _add_tasks(router, "a", 1, ["one"], task_ids=[1])
+    _add_tasks(router, "b", 2, ["same id, older sharding"], task_ids=[1])
+    _pin(directory, 1, "a")
+
+    with pytest.raises(MoveSkipped):
+        move_owner(directory, router, "a", "b", user_id=1, grace_seconds=0)
+
+    assert _task_ids(router, "a", user_id=1) == [1]
+    assert _task_ids(router, "b", user_id=2) == [1]
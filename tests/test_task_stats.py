@@ -0,0 +1,129 @@
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from models import DailyStats
+from task_stats import get_stats_for_range, update_daily_stats
+
+
+def _add_day(db, day: date, **totals):
+    db.add(DailyStats(user_id=1, day=day, **{
+        "focus_seconds": 0, "tasks_completed": 0, "timers_finished": 0, "timers_aborted": 0, **totals}))
+    db.commit()
+
+
+def test_range_is_the_difference_of_two_running_totals(session_factory):
+    db = session_factory()
+    _add_day(db, date(2026, 1, 1), focus_seconds=10, timers_finished=1)
+    _add_day(db, date(2026, 1, 3), focus_seconds=25, timers_finished=2)
+    _add_day(db, date(2026, 1, 5), focus_seconds=40, timers_finished=4, timers_aborted=1)
+
+    stats = get_stats_for_range(db, date(2026, 1, 2), date(2026, 1, 4), user_id=1)
+    assert (stats["focus_seconds"], stats["timers_finished"], stats["timers_aborted"]) == (15, 1, 0)
+
+    stats = get_stats_for_range(db, date(2026, 1, 1), date(2026, 1, 31), user_id=1)
+    assert (stats["focus_seconds"], stats["timers_finished"], stats["timers_aborted"]) == (40, 4, 1)
+
+    assert get_stats_for_range(db, date(2025, 12, 1), date(2025, 12, 31), user_id=1)["focus_seconds"] == 0
+    assert get_stats_for_range(db, date(2026, 2, 1), date(2026, 2, 28), user_id=1)["focus_seconds"] == 0
+    db.close()
+
+
+def test_new_day_starts_from_the_latest_totals(session_factory):
+    db = session_factory()
+    today = datetime.now().date()
+    _add_day(db, today - timedelta(days=3), focus_seconds=100, tasks_completed=7)
+
+    update_daily_stats(db, user_id=1, focus_seconds=30)
+    update_daily_stats(db, user_id=1, tasks_completed=1)
+    db.commit()
+
+    row = db.query(DailyStats).filter(DailyStats.user_id == 1, DailyStats.day == today).one()
+    assert (row.focus_seconds, row.tasks_completed) == (130, 8)
+    stats = get_stats_for_range(db, today, today, user_id=1)
+    assert (stats["focus_seconds"], stats["tasks_completed"]) == (30, 1)
+    db.close()
+
+
+def test_owners_are_counted_apart(session_factory):
+    db = session_factory()
+    update_daily_stats(db, user_id=1, timers_finished=1)
+    update_daily_stats(db, guest_id="guest", timers_finished=2)
+    db.commit()
+
+    today = datetime.now().date()
+    assert get_stats_for_range(db, today, today, user_id=1)["timers_finished"] == 1
+    assert get_stats_for_range(db, today, today, guest_id="guest")["timers_finished"] == 2
+    db.close()
+
+
+def test_unknown_field_is_rejected(session_factory):
+    db = session_factory()
+    with pytest.raises(ValueError):
+        update_daily_stats(db, user_id=1, focus=1)
+    db.close()
+
+
+def test_concurrent_increments_are_not_lost(session_factory):
+    threads_count, increments = 8, 5
+    start = threading.Barrier(threads_count)
+
+    def worker():
+        db = session_factory()
+        start.wait()
+        try:
+            for _ in range(increments):
+                update_daily_stats(db, user_id=1, focus_seconds=1, timers_finished=1)
+                db.commit()
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db = session_factory()
+    rows = db.query(DailyStats).filter(DailyStats.user_id == 1).all()
+    assert len(rows) == 1
+    assert rows[0].focus_seconds == rows[0].timers_finished == threads_count * increments
+    db.close()
+
+
+def _completed_today(client):
+    return client.get("/api/tasks/stats").json()["tasks_completed"]
+
+
+def _set_completed(client, task_id, is_completed):
+    response = client.put(f"/api/tasks/{task_id}", json={"is_completed": is_completed})
+    assert response.status_code == 200
+    assert response.json()["is_completed"] is is_completed
+
+
+def test_completing_a_task_is_counted_once(client):
+    task_id = client.post("/api/tasks/", json={"title": "Complete me"}).json()["id"]
+    completed_before = _completed_today(client)
+
+    _set_completed(client, task_id, True)
+    _set_completed(client, task_id, True)
+    assert _completed_today(client) == completed_before + 1
+
+    _set_completed(client, task_id, False)
+    _set_completed(client, task_id, False)
+    assert _completed_today(client) == completed_before
+
+
+def test_uncompleting_an_imported_task_does_not_go_negative(client):
+    completed_before = _completed_today(client)
+    imported = client.post(
+        "/api/tasks/import?format=ndjson", content=b'{"title": "Done elsewhere", "is_completed": true}\n')
+    assert imported.json()["imported"] == 1
+    task_id = max(task["id"] for task in client.get("/api/tasks/").json())
+
+    _set_completed(client, task_id, False)
+    assert _completed_today(client) == completed_before
+
+    _set_completed(client, task_id, True)
+    assert _completed_today(client) == completed_before + 1
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from models import DailyStats, Task, TimerSessionLog
+from routers.tasks import _finish_timers
+from timer_registry import ActiveTimer, TimerRegistry
+
+
+def test_restarted_timer_skips_its_stale_heap_entry():
+    registry = TimerRegistry()
+    registry.add("main", 1, 7, None, started=0, deadline=10)
+    registry.add("main", 1, 7, None, started=5, deadline=100)
+
+    assert registry.pop_expired(50) == []
+    assert registry.get("main", 1).deadline == 100
+
+    expired = registry.pop_expired(100)
+    assert [(timer.task_id, timer.deadline) for timer in expired] == [(1, 100)]
+    assert len(registry) == 0
+
+
+def test_removed_timer_does_not_expire():
+    registry = TimerRegistry()
+    registry.add("main", 1, 7, None, started=0, deadline=10)
+    registry.remove("main", 1)
+
+    assert registry.pop_expired(10) == []
+
+
+def test_timers_expire_earliest_first_per_shard():
+    registry = TimerRegistry()
+    registry.add("a", 1, 7, None, started=0, deadline=30)
+    registry.add("b", 1, 8, None, started=0, deadline=20)
+    registry.add("a", 2, 7, None, started=0, deadline=40)
+
+    assert [(timer.shard, timer.task_id) for timer in registry.pop_expired(30)] == [("b", 1), ("a", 1)]
+    assert ("a", 2) in registry
+
+
+def test_heap_is_rebuilt_when_restarts_pile_up():
+    registry = TimerRegistry()
+    for restart in range(1000):
+        registry.add("main", 1, 7, None, started=restart, deadline=1000 + restart)
+
+    assert len(registry._deadlines) <= 2 * len(registry) + 64
+    assert [timer.deadline for timer in registry.pop_expired(5000)] == [1999]
+
+
+def _running_task(db, task_id: int, timer_stop: datetime):
+    db.add(Task(
+        id=task_id, title="timer", user_id=1, timer_lenght=60, timer_active=True,
+        timer_start=timer_stop - timedelta(seconds=60), timer_stop=timer_stop))
+    db.commit()
+
+
+def test_expiry_leaves_a_restarted_timer_alone(session_factory):
+    db = session_factory()
+    expiry_time = datetime.now()
+    # Task 1 was restarted after the expiry job read the clock, task 2 is really due
+    _running_task(db, 1, expiry_time + timedelta(seconds=60))
+    _running_task(db, 2, expiry_time - timedelta(seconds=1))
+    stale = ActiveTimer("main", 1, 1, None, started=0, deadline=(expiry_time - timedelta(seconds=5)).timestamp())
+    due = ActiveTimer("main", 2, 1, None, started=0, deadline=(expiry_time - timedelta(seconds=1)).timestamp())
+
+    finished = _finish_timers(db, [stale, due], expiry_time)
+
+    assert [timer.task_id for timer in finished] == [2]
+    db.expire_all()
+    assert db.get(Task, 1).timer_active is True
+    assert db.get(Task, 2).timer_active is False
+    assert db.query(TimerSessionLog.task_id).all() == [(2,)]
+    assert db.query(DailyStats.timers_finished).all() == [(1,)]
+    db.close()
+
+
+def test_expiry_finishes_a_timer_once(session_factory):
+    db = session_factory()
+    expiry_time = datetime.now()
+    _running_task(db, 1, expiry_time - timedelta(seconds=1))
+    timer = ActiveTimer("main", 1, 1, None, started=0, deadline=(expiry_time - timedelta(seconds=1)).timestamp())
+
+    assert len(_finish_timers(db, [timer], expiry_time)) == 1
+    assert _finish_timers(db, [timer], expiry_time) == []
+    assert db.query(TimerSessionLog).count() == 1
+    db.close()
+
+
+@pytest.fixture
+def running_task(client):
+    task_id = client.post("/api/tasks/", json={"title": "Timer", "timer_lenght": 60}).json()["id"]
+    assert client.put(f"/api/tasks/{task_id}/timer_start").json()["timer_active"] is True
+    yield task_id
+    client.put(f"/api/tasks/{task_id}/timer_stop")
+
+
+def test_task_timer_socket_counts_down_for_the_owner(client, running_task):
+    with client.websocket_connect(f"/ws/timer/task/{running_task}") as websocket:
+        assert 58 <= int(websocket.receive_text()) <= 60
+
+
+def test_task_timer_socket_rejects_another_owner(client, running_task):
+    other_guest = TestClient(client.app, base_url="https://testserver")
+    other_guest.post("/api/tasks/", json={"title": "Someone else"})
+
+    with pytest.raises(WebSocketDisconnect) as error:
+        with other_guest.websocket_connect(f"/ws/timer/task/{running_task}") as websocket:
+            websocket.receive_text()
+    assert error.value.code == 1008